@@ -0,0 +1,553 @@
+"""
+中旋晴 性能基准测试
+
+无需显示器与音频设备即可运行：没有图形界面时以桩对象代替 Tk 窗口、画布与托盘，
+没有音频设备时使用 SDL 的 dummy 音频驱动。
+以自带的 miss_qing, miss_qing_official_texture, test 三个角色作为测试素材，
+结果写入 JSON 文件，可与其他提交的结果比较：
+
+    python benchmark.py -o bench.json
+    python benchmark.py -o new.json --compare bench.json
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tkinter as tk
+import tracemalloc
+import types
+from typing import Any, Callable, Hashable
+
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy") # 没有音频设备时也能初始化混音器
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+from PIL import Image
+
+import main
+
+
+ROOT: str = os.path.dirname(os.path.abspath(__file__))
+FIXTURES: list[str] = ["miss_qing", "miss_qing_official_texture", "test"]
+
+
+def peak_rss() -> int | None:
+    """进程的峰值常驻内存（字节），不支持的平台返回 None"""
+    try:
+        # Linux 上子进程的 ru_maxrss 会继承父进程的值，因此优先读取 VmHWM
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak: int = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def measure(func: Callable[[], Any], repeat: int) -> dict[str, Any]:
+    """多次运行并统计耗时（秒）"""
+    samples: list[float] = []
+    for _ in range(repeat):
+        start: float = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return {
+        "min": min(samples),
+        "median": statistics.median(samples),
+        "mean": statistics.fmean(samples),
+        "repeat": repeat,
+    }
+
+
+# 无图形界面时使用的桩对象
+class StubWidget:
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        self.options: dict[str, Any] = dict(kwargs)
+
+    def __getattr__(self, name: str) -> Callable[..., Any]:
+        return lambda *args, **kwargs: None
+
+    def config(self, **kwargs: Any) -> None:
+        self.options.update(kwargs)
+
+    def create_image(self, *args: Any, **kwargs: Any) -> int:
+        return 1
+
+
+class StubRoot(StubWidget):
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__()
+        self.tk: Any = types.SimpleNamespace(call=lambda *args: None)
+        self.geometry_string: str = "1x1+0+0"
+
+    def after(self, ms: int, func: Callable[..., Any], *args: Any) -> str:
+        return "after#stub" # 桩对象不运行事件循环，定时任务直接丢弃
+
+    def geometry(self, geometry: str | None = None) -> str:
+        if geometry is not None:
+            self.geometry_string = geometry
+        return self.geometry_string
+
+    def winfo_x(self) -> int:
+        return int(self.geometry_string.split("+")[1])
+
+    def winfo_y(self) -> int:
+        return int(self.geometry_string.split("+")[2])
+
+    def winfo_screenwidth(self) -> int:
+        return 1920
+
+    def winfo_screenheight(self) -> int:
+        return 1080
+
+
+class StubVariable:
+    def __init__(self, master: Any = None, value: Any = None) -> None:
+        self.value: Any = value
+
+    def get(self) -> Any:
+        return self.value
+
+    def set(self, value: Any) -> None:
+        self.value = value
+
+
+class StubPhoto:
+    """代替 ImageTk.PhotoImage：仍然复制一次像素，使开销与真实转换处于同一量级"""
+    def __init__(self, image: Image.Image, **kwargs: Any) -> None:
+        self.data: bytes = image.tobytes()
+        self.size: tuple[int, int] = image.size
+
+    def width(self) -> int:
+        return self.size[0]
+
+    def height(self) -> int:
+        return self.size[1]
+
+
+class StubTray:
+    icon: Any = None
+    title: str = ""
+
+    def update_menu(self) -> None:
+        pass
+
+    def stop(self) -> None:
+        pass
+
+
+def stub_create_tray(self: main.PetHost) -> None:
+    self.tray = StubTray() # type: ignore
+
+
+def has_display() -> bool:
+    try:
+        tk.Tk().destroy()
+        return True
+    except tk.TclError:
+        return False
+
+
+def install_stubs(display: bool) -> None:
+    """没有图形界面时以桩对象代替 Tk；托盘总是以桩对象代替，以免在测试时出现托盘图标"""
+    main.PetHost.create_tray = stub_create_tray # type: ignore
+    if display:
+        return
+    main.tk.Tk = StubRoot # type: ignore
+    main.tk.Toplevel = StubRoot # type: ignore
+    main.tk.Canvas = StubWidget # type: ignore
+    main.tk.PhotoImage = StubWidget # type: ignore
+    main.tk.DoubleVar = StubVariable # type: ignore
+    main.Menu = StubWidget # type: ignore
+    main.ImageTk.PhotoImage = StubPhoto # type: ignore
+
+
+def prepare_workdir(path: str, char: str, **options: Any) -> None:
+    """在 path 中写入指向 char 角色的配置文件，缓存也放在 path 中"""
+    os.makedirs(path, exist_ok=True)
+    cfg: dict[str, Any] = dict(main.default_config)
+    cfg.update({"char": os.path.join(ROOT, char), "cache_dir": os.path.join(path, "cache")}, **options)
+    main.dump_yaml(os.path.join(path, main.path_config), cfg)
+
+
+def create_app(workdir: str, char: str, **options: Any) -> main.FloatingImage:
+    """创建只有一个角色的宿主，返回该角色"""
+    prepare_workdir(workdir, char, **options)
+    os.chdir(workdir)
+    main.load_config()
+    main.config_store = main.ConfigStore(main.resource_path(main.path_config), main.config) # type: ignore
+    host = main.PetHost(main.tk.Tk())
+    host.finish_startup()
+    return host.pets[0]
+
+
+def wait_atlas(app: main.FloatingImage, timeout: float = 300) -> None:
+    """等待后台生成图集"""
+    deadline: float = time.perf_counter() + timeout
+    while not (hasattr(app, "frames") and app.frames.baked.is_set()) and time.perf_counter() < deadline:
+        time.sleep(0.001)
+
+
+def scaled_sprites(scales: list[float]) -> list[tuple[str, float, Image.Image]]:
+    sprites: list[tuple[str, float, Image.Image]] = []
+    for char in FIXTURES:
+        cfg: dict[str, Any] = dict(main.default_char_config)
+        cfg.update(main.load_yaml(os.path.join(ROOT, char, main.path_char_config)))
+        image: Image.Image = Image.open(os.path.join(ROOT, char, cfg.get("image_active", cfg["image"]))).convert("RGBA")
+        for scale in scales:
+            size = (max(int(image.size[0] * scale), 1), max(int(image.size[1] * scale), 1))
+            sprites.append((char, scale, image.resize(size, Image.Resampling.NEAREST)))
+    return sprites
+
+
+def bench_load_image(workdir: str, repeat: int) -> list[dict[str, Any]]:
+    results: list[dict[str, Any]] = []
+    for char in FIXTURES:
+        app = create_app(os.path.join(workdir, f"load_{char}"), char)
+        results.append({"name": "load_image", "char": char, **measure(app.load_image, repeat)})
+        app.host.quit()
+    return results
+
+
+def bench_switch_char(workdir: str, repeat: int) -> list[dict[str, Any]]:
+    """切换至角色文件夹与切换至由其导出的角色包的耗时（动画帧均已生成）"""
+    results: list[dict[str, Any]] = []
+    for char in FIXTURES:
+        app = create_app(os.path.join(workdir, f"switch_{char}"), char)
+        wait_atlas(app)
+        folder: str = app.char
+        pack: str = os.path.join(workdir, f"switch_{char}", char + main.CharPack.SUFFIX)
+        main.filedialog.asksaveasfilename = lambda **kwargs: pack # type: ignore
+        app.export_pack()
+        for label, path in (("folder", folder), ("pack", pack)):
+            def switch() -> None:
+                app.reload_char(path)
+            results.append({"name": f"switch_char.{label}", "char": char, **measure(switch, repeat)})
+        app.host.quit()
+    return results
+
+
+def bench_rescale(workdir: str, repeat: int) -> list[dict[str, Any]]:
+    """更改显示缩放比例的耗时（至显示待机图片）与随后在后台生成图集的耗时"""
+    results: list[dict[str, Any]] = []
+    for char in FIXTURES:
+        app = create_app(os.path.join(workdir, f"rescale_{char}"), char)
+        wait_atlas(app)
+        cache_dir: str = main.resource_path(main.config["cache_dir"])
+        for scale in (0.5, 2.0):
+            rescale: list[float] = []
+            bake: list[float] = []
+            for _ in range(repeat):
+                app.host.set_scale(1.0)
+                wait_atlas(app)
+                shutil.rmtree(cache_dir, ignore_errors=True)
+                start: float = time.perf_counter()
+                app.host.set_scale(scale)
+                rescale.append(time.perf_counter() - start)
+                wait_atlas(app)
+                bake.append(time.perf_counter() - start)
+            results.append({"name": "rescale", "char": char, "scale": scale, "min": min(rescale), "median": statistics.median(rescale), "repeat": repeat})
+            results.append({"name": "rescale.bake", "char": char, "scale": scale, "min": min(bake), "median": statistics.median(bake), "repeat": repeat})
+        app.host.set_scale(1.0)
+        app.host.quit()
+    return results
+
+
+def bench_threshold(sprites: list[tuple[str, float, Image.Image]], repeat: int) -> list[dict[str, Any]]:
+    return [
+        {"name": "threshold", "char": char, "scale": scale, "size": list(image.size), **measure(lambda: main.threshold(image), repeat)}
+        for char, scale, image in sprites
+    ]
+
+
+def bench_gen_frames(
+    workdir: str, sprites: list[tuple[str, float, Image.Image]], fps_values: list[int], repeat: int
+) -> list[dict[str, Any]]:
+    """
+    gen_frames 本身只准备按需生成的帧序列，因此分别统计：
+    冷启动（无缓存）时 gen_frames 的耗时与后台生成完整图集的耗时，以及命中缓存时 gen_frames 的耗时
+    """
+    results: list[dict[str, Any]] = []
+    app = create_app(os.path.join(workdir, "gen_frames"), FIXTURES[0])
+    wait_atlas(app) # 避免创建窗口时启动的后台生成与测试互相干扰
+    cache_dir: str = main.resource_path(main.config["cache_dir"])
+    for char, scale, image in sprites:
+        for fps in fps_values:
+            for smooth in (True, False):
+                main.config["fps"] = fps
+                app.char_config["smooth"] = smooth
+                app.sprite_active = main.Sprite.from_image(image)
+                setup: list[float] = []
+                bake: list[float] = []
+                warm: list[float] = []
+                peak: int = 0
+                for _ in range(repeat):
+                    shutil.rmtree(cache_dir, ignore_errors=True)
+                    app.host.frame_sets.clear() # 不共用内存中已有的动画帧
+                    tracemalloc.start()
+                    start: float = time.perf_counter()
+                    app.gen_frames()
+                    setup.append(time.perf_counter() - start)
+                    wait_atlas(app)
+                    bake.append(time.perf_counter() - start)
+                    peak = max(peak, tracemalloc.get_traced_memory()[1])
+                    tracemalloc.stop()
+                    app.host.frame_sets.clear()
+                    start = time.perf_counter()
+                    app.gen_frames()
+                    warm.append(time.perf_counter() - start)
+                params: dict[str, Any] = {"char": char, "scale": scale, "size": list(image.size), "fps": fps, "smooth": smooth}
+                results.append({"name": "gen_frames.cold", **params, "min": min(setup), "median": statistics.median(setup), "repeat": repeat})
+                results.append({"name": "gen_frames.bake", **params, "min": min(bake), "median": statistics.median(bake), "repeat": repeat, "peak_traced_bytes": peak})
+                results.append({"name": "gen_frames.warm", **params, "min": min(warm), "median": statistics.median(warm), "repeat": repeat})
+                if app.frame_atlas is not None:
+                    results[-1]["atlas_bytes"] = app.frame_atlas.nbytes
+                    results[-1]["unique_frames"] = app.frame_atlas.unique_count
+    app.host.quit()
+    return results
+
+
+def bench_display(workdir: str, display: bool) -> list[dict[str, Any]]:
+    """逐帧调用 display_image 的耗时：首轮需转换 PhotoImage（内容相同的帧只转换一次），次轮复用"""
+    results: list[dict[str, Any]] = []
+    for char in FIXTURES:
+        app = create_app(os.path.join(workdir, f"display_{char}"), char)
+        wait_atlas(app)
+        frames: list[main.Frame] = [app.release_animation[i] for i in range(len(app.release_animation))]
+        keys: list[Hashable] = [app.frames.frame_id("release", i) for i in range(len(frames))]
+        for label in ("convert", "reuse"):
+            samples: list[float] = []
+            for index, frame in enumerate(frames):
+                start: float = time.perf_counter()
+                app.display_image(frame, keys[index])
+                samples.append(time.perf_counter() - start)
+            results.append({
+                "name": f"display_image.{label}", "char": char, "backend": "tk" if display else "stub",
+                "min": min(samples), "median": statistics.median(samples), "mean": statistics.fmean(samples),
+                "repeat": len(samples), "unique_frames": len(set(keys)),
+            })
+        app.host.quit()
+    return results
+
+
+def press_event(app: main.FloatingImage) -> types.SimpleNamespace:
+    """落在当前显示的动画帧的不透明像素上的点击事件"""
+    frame: main.Frame = app.shown_frame
+    width, height = frame.image.size
+    x, y = next((x, y) for y in range(height) for x in range(width) if frame.hit(x, y))
+    return types.SimpleNamespace(x=app.tk_image_pos[0] + x, y=app.tk_image_pos[1] + y, x_root=0, y_root=0)
+
+
+def bench_input(workdir: str, repeat: int) -> list[dict[str, Any]]:
+    """
+    输入事件突发：每帧到达 per_frame 个拖动事件或按键自动重复事件，
+    统计每个事件的平均处理耗时（含每帧一次的合并处理）
+    """
+    results: list[dict[str, Any]] = []
+    app = create_app(os.path.join(workdir, "input"), FIXTURES[0])
+    wait_atlas(app)
+    count: int = 2000
+    for per_frame in (1, 4, 16):
+        def drag() -> None:
+            # 单击一次后，在释放动画中途按下才会开始拖动
+            app.on_mouse_press(press_event(app))
+            app.on_mouse_release(types.SimpleNamespace())
+            app.on_mouse_press(press_event(app))
+            for i in range(count):
+                app.on_drag(types.SimpleNamespace(x_root=i % 200, y_root=i % 100))
+                if i % per_frame == per_frame - 1:
+                    app.apply_input()
+            app.on_mouse_release(types.SimpleNamespace())
+
+        def key_repeat() -> None:
+            app.on_key_press(types.SimpleNamespace(keysym="a"))
+            for i in range(count // 2): # X11 的自动重复：成对的松开与按下
+                app.on_key_release(types.SimpleNamespace(keysym="a"))
+                app.on_key_press(types.SimpleNamespace(keysym="a"))
+                if i % per_frame == per_frame - 1:
+                    app.apply_input()
+            app.on_key_release(types.SimpleNamespace(keysym="a"))
+            app.apply_input()
+
+        for label, func in (("drag", drag), ("key_repeat", key_repeat)):
+            timing: dict[str, Any] = measure(func, repeat)
+            results.append({
+                "name": f"input.{label}", "per_frame": per_frame,
+                "min": timing["min"] / count, "median": timing["median"] / count, "repeat": repeat,
+            })
+    app.host.quit()
+    return results
+
+
+def bench_startup(workdir: str, repeat: int) -> list[dict[str, Any]]:
+    """在子进程中运行 main()：冷启动不带缓存，热启动复用冷启动生成的缓存"""
+    results: list[dict[str, Any]] = []
+    for char in FIXTURES:
+        path: str = os.path.join(workdir, f"startup_{char}")
+        for label in ("cold", "warm"):
+            samples: list[float] = []
+            children: list[dict[str, Any]] = []
+            for _ in range(repeat):
+                if label == "cold":
+                    shutil.rmtree(path, ignore_errors=True)
+                    prepare_workdir(path, char)
+                start: float = time.perf_counter()
+                output: str = subprocess.run(
+                    [sys.executable, os.path.abspath(__file__), "--startup-child", path],
+                    check=True, capture_output=True, text=True,
+                ).stdout
+                samples.append(time.perf_counter() - start)
+                children.append(json.loads(output.strip().splitlines()[-1]))
+            results.append({
+                "name": f"startup.{label}", "char": char,
+                "process_min": min(samples), "process_median": statistics.median(samples),
+                "main_min": min(child["main"] for child in children),
+                "main_median": statistics.median(child["main"] for child in children),
+                "first_paint_min": min(child["first_paint"] for child in children),
+                "first_paint_median": statistics.median(child["first_paint"] for child in children),
+                "peak_rss": max((child["peak_rss"] or 0) for child in children) or None,
+                "repeat": repeat,
+            })
+    return results
+
+
+def startup_child(path: str) -> None:
+    """
+    子进程：计时 main() 直至全部初始化阶段完成（有图形界面时运行事件循环直至完成，否则直接执行剩余阶段），
+    以及自导入 main 起至首次绘制的耗时，等待缓存写入后输出结果
+    """
+    display: bool = has_display()
+    install_stubs(display)
+    hosts: list[main.PetHost] = []
+    original_init = main.PetHost.__init__
+    def init(self: main.PetHost, *args: Any, **kwargs: Any) -> None:
+        hosts.append(self)
+        original_init(self, *args, **kwargs)
+    main.PetHost.__init__ = init # type: ignore
+    if display:
+        original_mainloop = tk.Tk.mainloop
+        def mainloop(self: tk.Tk, n: int = 0) -> None:
+            def poll() -> None:
+                if all(not host.stages for host in hosts):
+                    self.quit()
+                else:
+                    self.after(1, poll)
+            self.after(0, poll)
+            original_mainloop(self, n)
+        tk.Tk.mainloop = mainloop # type: ignore
+
+    os.chdir(path)
+    start: float = time.perf_counter()
+    main.main()
+    for host in hosts:
+        host.finish_startup()
+    elapsed: float = time.perf_counter() - start
+    for host in hosts:
+        for app in host.pets:
+            wait_atlas(app)
+    first_paint: float = min(host.first_paint_time for host in hosts)
+    print(json.dumps({"main": elapsed, "first_paint": first_paint, "peak_rss": peak_rss()}))
+    sys.stdout.flush()
+    os._exit(0)
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=ROOT, check=True, capture_output=True, text=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+KEY_FIELDS: tuple[str, ...] = ("name", "char", "scale", "size", "fps", "smooth", "backend", "per_frame")
+
+
+def result_key(result: dict[str, Any]) -> tuple[str, ...]:
+    """用于在两次结果之间匹配同一测试项"""
+    return tuple(json.dumps(result.get(field)) for field in KEY_FIELDS)
+
+
+def compare(old_path: str, new: dict[str, Any]) -> None:
+    """打印与旧结果相比的耗时变化"""
+    with open(old_path, "r") as f:
+        old: dict[str, Any] = json.load(f)
+    baseline: dict[tuple[str, ...], dict[str, Any]] = {result_key(result): result for result in old["results"]}
+    print(f"与 {old.get('revision')} 相比：")
+    for result in new["results"]:
+        before = baseline.get(result_key(result))
+        metric: str = "median" if "median" in result else "main_median"
+        if before is None or not before.get(metric) or metric not in result:
+            continue
+        ratio: float = result[metric] / before[metric]
+        params: str = " ".join(f"{field}={result[field]}" for field in KEY_FIELDS[1:] if field in result)
+        print(f"  {result['name']:<24} {params:<60} {before[metric] * 1000:10.3f} ms -> {result[metric] * 1000:10.3f} ms ({ratio:6.2f}x)")
+
+
+def main_benchmark() -> None:
+    parser = argparse.ArgumentParser(description="中旋晴 性能基准测试")
+    parser.add_argument("-o", "--output", default="bench.json", help="结果文件（JSON）")
+    parser.add_argument("--quick", action="store_true", help="缩小测试规模")
+    parser.add_argument("--compare", metavar="OLD", help="与旧的结果文件比较")
+    parser.add_argument("--startup-child", metavar="DIR", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.startup_child:
+        startup_child(args.startup_child)
+        return
+
+    display: bool = has_display()
+    install_stubs(display)
+    repeat: int = 1 if args.quick else 3
+    scales: list[float] = [1.0] if args.quick else [0.5, 1.0, 2.0]
+    fps_values: list[int] = [60] if args.quick else [30, 60, 144]
+    sprites = scaled_sprites(scales)
+
+    cwd: str = os.getcwd()
+    results: list[dict[str, Any]] = []
+    with tempfile.TemporaryDirectory(prefix="qing-bench-") as workdir:
+        try:
+            for title, run in (
+                ("load_image", lambda: bench_load_image(workdir, repeat * 5)),
+                ("switch_char", lambda: bench_switch_char(workdir, repeat * 5)),
+                ("threshold", lambda: bench_threshold(sprites, repeat * 5)),
+                ("gen_frames", lambda: bench_gen_frames(workdir, sprites, fps_values, repeat)),
+                ("display_image", lambda: bench_display(workdir, display)),
+                ("rescale", lambda: bench_rescale(workdir, repeat)),
+                ("input", lambda: bench_input(workdir, repeat)),
+                ("startup", lambda: bench_startup(workdir, repeat)),
+            ):
+                print(f"{title}…", file=sys.stderr)
+                results.extend(run())
+        finally:
+            os.chdir(cwd)
+
+    report: dict[str, Any] = {
+        "revision": git_revision(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "display": "tk" if display else "stub",
+        "peak_rss": peak_rss(),
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, ensure_ascii=False, indent=1)
+    print(f"结果已写入 {args.output}", file=sys.stderr)
+    if args.compare:
+        compare(args.compare, report)
+
+
+if __name__ == "__main__":
+    main_benchmark()
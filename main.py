@@ -1,21 +1,65 @@
-import shutil
+from __future__ import annotations
 import time
+START_TIME: float = time.perf_counter() # 开始导入的时刻，用于统计启动耗时
+import shutil
+import hashlib
+import io
+import struct
+import mmap
 import tkinter as tk
 from tkinter import filedialog, Menu
-from typing import NotRequired, TypedDict
+from typing import TYPE_CHECKING, Any, BinaryIO, Callable, Hashable, Iterator, NotRequired, Sequence, TypedDict
+from collections import OrderedDict, deque
+from concurrent.futures import CancelledError, Future, ProcessPoolExecutor, ThreadPoolExecutor, as_completed
 from PIL import Image, ImageTk, ImageDraw
-import pygame
 import threading
-import pystray
-from pystray import MenuItem
+import queue
+import multiprocessing
 import sys
 import os
 import random
-import easing_functions as easing
+import functools
+import itertools
+import weakref
+import bisect
+import math
+import json
+import importlib.util
 import yaml
 from dataclasses import dataclass
 
 
+def lazy_import(name: str) -> Any:
+    """
+    延迟导入模块：立即返回模块对象，首次访问其属性时才真正执行导入
+    :param name: 模块名
+    :return: 模块
+    """
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+    spec = importlib.util.find_spec(name)
+    if spec is None or spec.loader is None:
+        raise ModuleNotFoundError(f"No module named {name!r}", name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+
+
+# 显示待机图片之前用不到的模块延迟导入（pygame 只在音效引擎的工作线程中导入，pystray 在创建托盘时导入）
+if TYPE_CHECKING:
+    import numpy as np
+    import easing_functions as easing
+    import pygame
+    import pystray
+else:
+    np = lazy_import("numpy")
+    easing = lazy_import("easing_functions")
+
+
 # 确保打包后能找到资源
 def resource_path(relative_path: str) -> str:
     """获取资源的绝对路径（用于pyinstaller打包）"""
@@ -28,21 +72,51 @@ def resource_path(relative_path: str) -> str:
 
 
 path_config: str = "config.yml"
+class PetConfig(TypedDict):
+    char: str # 角色文件夹或角色包
+    x: NotRequired[int]; y: NotRequired[int] # 窗口坐标（锚点位于底部）
+
 class Config(TypedDict):
-    char: str # 当前所选自定义角色的文件夹
+    char: str # 当前所选自定义角色的文件夹或角色包（第一个角色）
+    pets: list[PetConfig] # 同时显示的其余角色
     fps: int # 帧率
+    governor: bool # 负载过高时自动降低帧率？
     topmost: bool # 置顶？
+    scale: float # 所有角色的显示缩放比例（与角色配置中的缩放比例相乘）
     echo: bool # 音效可叠加？若是，则高速戳晴时很可能会吞音
     cooldown: float # 冷却时间（秒）
-    x: NotRequired[int]; y: NotRequired[int] # 窗口坐标（锚点位于底部）
+    cache_dir: str # 动画帧缓存文件夹
+    cache_size: int # 动画帧缓存容量上限（MiB）
+    frame_memory: int # 内存中动画帧的容量上限（MiB）
+    decode_memory: int # 每张动图解码后的帧的容量上限（MiB）
+    audio_buffer: int # 混音器缓冲区大小（采样数），越小延迟越低
+    voices: int # 可同时播放的音效数，超出时停止最早播放的音效
+    watch: bool # 监视角色文件夹，素材变化时立即热重载？
+    metrics_file: str # 定期写入性能统计的JSONL文件，为空则不写入
+    metrics_interval: float # 写入性能统计的间隔（秒）
+    startup_report: bool # 启动时输出首次绘制及各初始化阶段的耗时？
+    x: NotRequired[int]; y: NotRequired[int] # 第一个角色的窗口坐标（锚点位于底部）
 
 config: Config
 default_config: Config = Config({
     "char": "./miss_qing",
+    "pets": [],
     "fps": 60,
+    "governor": True,
     "topmost": True,
+    "scale": 1.0,
     "echo": False,
     "cooldown": 1/60,
+    "cache_dir": "./cache",
+    "cache_size": 256,
+    "frame_memory": 64,
+    "decode_memory": 32,
+    "audio_buffer": 512,
+    "voices": 8,
+    "watch": False,
+    "metrics_file": "",
+    "metrics_interval": 10.0,
+    "startup_report": False,
 })
 
 
@@ -50,19 +124,21 @@ path_char_config: str = "config.yml"
 class CharConfig(TypedDict):
     name: str # 角色名
     sound: str # 中旋音效文件相对路径
-    image: str # 晴立绘文件相对路径
+    image: str # 晴立绘文件相对路径（可以是动图，将循环播放）
     # image_link: NotRequired[str] # 未戳过
     # image_hover: NotRequired[str] # 悬停时
-    image_active: NotRequired[str] # 戳动画
+    image_active: NotRequired[str] # 戳动画（可以是动图，将与缩放动画叠加）
     # image_visited: NotRequired[str] # 戳完后
     icon: NotRequired[str] # 托盘图标文件相对路径
     miyu_color: str # 将被视为透明的颜色
     smooth: NotRequired[bool] # 平滑图像缩放？
+    scale: NotRequired[float] # 立绘的显示缩放比例
     factor: float # 弹性系数
     duration: float # 回弹动画时长（秒）
     duration_active: float # 按下动画时长（秒）
+    press_curve: NotRequired[str | dict[str, Any]] # 按下动画的缓动曲线
+    release_curve: NotRequired[str | dict[str, Any]] # 回弹动画的缓动曲线
 
-char_config: CharConfig
 default_char_config: CharConfig = CharConfig({
     "name": "晴小姐", 
     "sound": "sndReverbClack.wav", 
@@ -74,43 +150,370 @@ default_char_config: CharConfig = CharConfig({
 })
 
 
-def press_easing_curve(t: float) -> tuple[float, float]:
-    ease_func = easing.ElasticEaseOut(start=0, end=char_config["factor"], duration=1) # type: ignore
-    ease_val: float = ease_func.ease(t)
-    return 1 - ease_val, 1 + ease_val
- 
+# 可选的缓动曲线族：linear, 以及 {quad, cubic, quartic, quintic, sine, circular, exponential, elastic, back, bounce}_{in, out, in_out}
+EASING_FAMILIES: dict[str, str] = {"linear": "LinearInOut"} | { # 曲线族名 -> easing_functions 中的类名
+    f"{name}_{mode}": f"{name.capitalize()}Ease{suffix}"
+    for name in ("quad", "cubic", "quartic", "quintic", "sine", "circular", "exponential", "elastic", "back", "bounce")
+    for mode, suffix in (("in", "In"), ("out", "Out"), ("in_out", "InOut"))
+}
+DEFAULT_EASING: str = "elastic_out"
+
+
+def char_scale(cfg: CharConfig) -> float:
+    """角色的显示缩放比例：全局缩放比例与角色缩放比例之积"""
+    return config["scale"] * cfg.get("scale", 1.0)
 
-def release_easing_curve(t: float) -> tuple[float, float]:
-    ease_func = easing.ElasticEaseOut(start=char_config["factor"], end=0, duration=1) # type: ignore
-    ease_val: float = ease_func.ease(t)
-    return 1 - ease_val, 1 + ease_val
+def clamp_factor(factor: float) -> float:
+    """限制弹性系数的范围"""
+    return min(max(factor, -0.625), 0.625)
 
 
-def load_config() -> None:
+def parse_curve(spec: str | dict[str, Any] | None, factor: float) -> tuple[tuple[str, float], tuple[str, float]]:
+    """
+    解析角色配置中的缓动曲线
+    :param spec: 曲线族名（两轴相同）；或 {family, factor}；或分别指定两轴的 {x, y}，每轴为曲线族名或 {family, factor}
+    :param factor: 未指定时使用的弹性系数
+    :return: 横轴与纵轴的 (曲线族, 弹性系数)
+    """
+    if spec is None:
+        spec = DEFAULT_EASING
+    axes = (spec, spec) if isinstance(spec, str) or "family" in spec else (spec.get("x", DEFAULT_EASING), spec.get("y", DEFAULT_EASING))
+    result: list[tuple[str, float]] = []
+    for axis in axes:
+        family, axis_factor = (axis, factor) if isinstance(axis, str) else (axis.get("family", DEFAULT_EASING), axis.get("factor", factor))
+        if family not in EASING_FAMILIES:
+            raise ValueError(f"未知的缓动曲线：{family}")
+        result.append((family, clamp_factor(float(axis_factor))))
+    return result[0], result[1]
+
+
+class EasingCurve:
+    """
+    编译为查找表的缓动曲线，取值为横纵两轴的缩放系数
+
+    曲线在编译时逐点求值一次，此后按任意时刻取值时在查找表上插值，
+    按帧取值时则使用按帧数编译的精确查找表
+    """
+    RESOLUTION: int = 1024 # 查找表的采样数
+
+    def __init__(self, axes: tuple[tuple[str, float], tuple[str, float]], release: bool) -> None:
+        """
+        :param axes: 横轴与纵轴的 (曲线族, 弹性系数)
+        :param release: 是否为回弹曲线（由弹性系数回到0；否则由0到弹性系数）
+        """
+        self.axes: tuple[tuple[str, float], tuple[str, float]] = axes
+        self.release: bool = release
+        self.grid: np.ndarray = np.linspace(0, 1, self.RESOLUTION + 1)
+        self.table: np.ndarray = self.evaluate(self.grid)
+        self.frame_tables: dict[float, np.ndarray] = {}
+
+    def evaluate(self, ts: np.ndarray) -> np.ndarray:
+        """逐点求值，返回 (采样数, 2) 的缩放系数"""
+        columns: list[np.ndarray] = []
+        for (family, factor), sign in zip(self.axes, (-1, 1)): # 横轴收缩时纵轴伸长
+            start, end = (factor, 0) if self.release else (0, factor)
+            func = getattr(easing, EASING_FAMILIES[family])(start=start, end=end, duration=1)
+            values = np.fromiter((func.ease(t) for t in ts), dtype=np.float64, count=len(ts))
+            columns.append(1 + sign * values)
+        return np.stack(columns, axis=1)
+
+    def __call__(self, t: float) -> tuple[float, float]:
+        return float(np.interp(t, self.grid, self.table[:, 0])), float(np.interp(t, self.grid, self.table[:, 1]))
+
+    def frames(self, length: float) -> np.ndarray:
+        """
+        按帧取值
+        :param length: 动画时长（帧），第 i 帧位于 i / length 处
+        :return: (帧数, 2) 的缩放系数
+        """
+        table = self.frame_tables.get(length)
+        if table is None:
+            table = self.frame_tables[length] = self.evaluate(np.arange(int(length)) / length)
+        return table
+
+
+@functools.lru_cache(maxsize=32)
+def compile_curve(axes: tuple[tuple[str, float], tuple[str, float]], release: bool) -> EasingCurve:
+    return EasingCurve(axes, release)
+
+
+def char_curves(cfg: CharConfig) -> tuple[EasingCurve, EasingCurve]:
+    """取得角色的按下与回弹缓动曲线（同一配置只编译一次）"""
+    return (
+        compile_curve(parse_curve(cfg.get("press_curve"), cfg["factor"]), False),
+        compile_curve(parse_curve(cfg.get("release_curve"), cfg["factor"]), True),
+    )
+
+
+# 优先使用 libyaml 实现的安全加载器
+YAML_LOADER: type = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+YAML_DUMPER: type = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+
+def load_yaml(path: str) -> dict[str, Any]:
+    with open(path, "r") as f:
+        return yaml.load(f, Loader=YAML_LOADER) or {}
+
+def dump_yaml(path: str, data: dict[str, Any]) -> None:
+    """原子地写入YAML文件（先写临时文件再替换，写入中途崩溃也不会截断原文件）"""
+    temp_path: str = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(temp_path, "w") as f:
+            yaml.dump(data, f, Dumper=YAML_DUMPER)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+def load_config() -> dict[str, Any]:
+    """加载配置，返回配置文件中的原始内容"""
     global config
-    with open(resource_path(path_config), "r") as f:
-        config = default_config.copy()
-        config.update(yaml.load(f, Loader=yaml.FullLoader))
-
-def load_char_config() -> None:
-    global char_config
-    with open(char_res_path(path_char_config), "r") as f:
-        char_config = default_char_config.copy()
-        char_config.update(yaml.load(f, Loader=yaml.FullLoader))
-    if char_config["factor"] < -0.625:
-        char_config["factor"] = -0.625
-    if char_config["factor"] > 0.625:
-        char_config["factor"] = 0.625
+    loaded = load_yaml(resource_path(path_config))
+    config = default_config.copy()
+    config.update(loaded) # type: ignore
+    return loaded
+
+def load_char_config(path: str | None = None) -> CharConfig:
+    """
+    加载角色配置
+    :param path: 角色文件夹或角色包，默认为 config["char"]
+    :return: 角色配置
+    """
+    char_config: CharConfig = default_char_config.copy()
+    if is_char_pack(path):
+        char_config.update(load_char_pack(config["char"] if path is None else path).config) # type: ignore
+    else:
+        char_config.update(load_yaml(char_res_path(path_char_config, path))) # type: ignore
+    char_config["factor"] = clamp_factor(char_config["factor"])
+    for key in ("press_curve", "release_curve"):
+        try:
+            parse_curve(char_config.get(key), char_config["factor"]) # type: ignore
+        except (ValueError, TypeError, AttributeError) as e:
+            print(e)
+            char_config.pop(key, None) # type: ignore
+    return char_config
 
 def dump_config(cfg: Config | None = None, /) -> None:
     if cfg is None: cfg = config
-    with open(resource_path(path_config), "w") as f:
-        yaml.dump(cfg, f)
+    dump_yaml(resource_path(path_config), dict(cfg))
 
-def dump_char_config(cfg: CharConfig | None = None, /) -> None:
-    if cfg is None: cfg = char_config
-    with open(char_res_path(path_char_config), "w") as f:
-        yaml.dump(cfg, f)
+def dump_char_config(cfg: CharConfig, path: str | None = None, /) -> None:
+    dump_yaml(char_res_path(path_char_config, path), dict(cfg))
+
+
+class ConfigStore:
+    """
+    配置存储：在后台线程中合并、延迟写入配置文件
+
+    修改后等待一段时间无新修改才写入，且只将修改过的字段合并进文件的最新内容，
+    因此不会覆盖运行期间对文件中其他字段的手动修改
+    """
+    def __init__(self, path: str, data: dict[str, Any], delay: float = 1.0) -> None:
+        """
+        :param path: 配置文件路径
+        :param data: 内存中的配置（修改时同步更新）
+        :param delay: 最后一次修改后延迟写入的时间（秒）
+        """
+        self.path: str = path
+        self.data: dict[str, Any] = data
+        self.delay: float = delay
+        self.dirty: dict[str, Any] = {} # 待写入的字段
+        self.changed_at: float = 0.0 # 最后一次修改的时间
+        self.closed: bool = False
+        self.cond: threading.Condition = threading.Condition()
+        self.write_lock: threading.Lock = threading.Lock()
+        self.thread: threading.Thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def set(self, key: str, value: Any) -> None:
+        """修改配置项，并安排写入"""
+        with self.cond:
+            if self.data.get(key) == value and key not in self.dirty:
+                return
+            self.data[key] = value
+            self.dirty[key] = value
+            self.changed_at = time.monotonic()
+            self.cond.notify()
+
+    def run(self) -> None:
+        while True:
+            with self.cond:
+                while not self.dirty and not self.closed:
+                    self.cond.wait()
+                if self.closed:
+                    return
+                # 等待修改平息
+                while not self.closed:
+                    remaining: float = self.changed_at + self.delay - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.cond.wait(remaining)
+                fields, self.dirty = self.dirty, {}
+            self.write(fields)
+
+    def write(self, fields: dict[str, Any]) -> None:
+        if not fields:
+            return
+        with self.write_lock:
+            try:
+                data: dict[str, Any] = load_yaml(self.path) if os.path.exists(self.path) else {}
+                data.update(fields)
+                dump_yaml(self.path, data)
+            except Exception as e:
+                print(e)
+
+    def flush(self) -> None:
+        """立即写入所有修改"""
+        with self.cond:
+            fields, self.dirty = self.dirty, {}
+        self.write(fields)
+
+    def close(self) -> None:
+        """写入所有修改并停止后台线程"""
+        with self.cond:
+            self.closed = True
+            self.cond.notify()
+        self.thread.join()
+        self.flush()
+
+config_store: ConfigStore
+
+
+class Histogram:
+    """
+    耗时直方图：桶的上界按 √2 倍递增（10 µs ~ 10 s），
+    记录一次只需一次二分查找，内存占用固定，百分位数的误差不超过一个桶
+    """
+    BOUNDS: tuple[float, ...] = tuple(1e-5 * 2 ** (i / 2) for i in range(41)) # 各桶上界（秒）
+
+    def __init__(self) -> None:
+        self.buckets: list[int] = [0] * (len(self.BOUNDS) + 1) # 最后一个桶收纳超出上界的值
+        self.count: int = 0
+        self.total: float = 0.0
+        self.max: float = 0.0
+
+    def record(self, value: float) -> None:
+        self.buckets[bisect.bisect_left(self.BOUNDS, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def percentile(self, q: float) -> float:
+        """估计百分位数（取所在桶的上界，且不超过最大值）"""
+        if self.count == 0:
+            return 0.0
+        rank: float = q * self.count
+        seen: int = 0
+        for bound, count in zip(self.BOUNDS, self.buckets):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def snapshot(self) -> dict[str, Any]:
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0.0,
+            "p50": self.percentile(0.5),
+            "p90": self.percentile(0.9),
+            "p99": self.percentile(0.99),
+            "max": self.max,
+            "buckets": {f"{bound:.6g}": count for bound, count in zip(self.BOUNDS + (float("inf"),), self.buckets) if count},
+        }
+
+
+class Metrics:
+    """
+    运行时性能统计（线程安全）：各热点路径的耗时直方图，以及丢帧等计数
+
+    数据自程序启动起累计，定期写入的JSONL文件中每行都是一份完整快照
+    """
+    # 统计项及其含义
+    NAMES: dict[str, str] = {
+        "gen_frames": "准备动画帧",
+        "bake_atlas": "后台生成图集",
+        "display_image": "显示一帧",
+        "lateness": "动画帧调度延迟",
+        "frame_busy": "每帧主线程耗时",
+        "input_to_frame": "输入至首帧",
+        "press_to_sound": "输入至播放音效",
+        "first_paint": "启动至首次绘制",
+    }
+
+    def __init__(self) -> None:
+        self.histograms: dict[str, Histogram] = {name: Histogram() for name in self.NAMES}
+        self.counters: dict[str, int] = {
+            "frames": 0, "dropped_frames": 0, "skipped_frames": 0, "input_events": 0, "input_applied": 0, "tier_down": 0, "tier_up": 0
+        }
+        self.gauges: dict[str, Any] = {"tier": 0} # 当前值（如帧率档位）
+        self.start_time: float = time.time()
+        self.lock: threading.Lock = threading.Lock()
+
+    def record(self, name: str, value: float) -> None:
+        """记录一次耗时（秒）"""
+        with self.lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.record(value)
+
+    def count(self, name: str, n: int = 1) -> None:
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def set(self, name: str, value: Any) -> None:
+        """记录当前值"""
+        with self.lock:
+            self.gauges[name] = value
+
+    def snapshot(self) -> dict[str, Any]:
+        with self.lock:
+            return {
+                "time": time.time(),
+                "uptime": time.time() - self.start_time,
+                "histograms": {name: histogram.snapshot() for name, histogram in self.histograms.items()},
+                "counters": dict(self.counters),
+                "gauges": dict(self.gauges),
+            }
+
+    def dump(self, path: str) -> None:
+        """向JSONL文件追加一份快照"""
+        try:
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(self.snapshot(), ensure_ascii=False) + "\n")
+        except OSError as e:
+            print(e)
+
+    def report(self) -> str:
+        """人类可读的摘要"""
+        snapshot = self.snapshot()
+        frames, dropped = snapshot["counters"]["frames"], snapshot["counters"]["dropped_frames"]
+        skipped: int = snapshot["counters"]["skipped_frames"]
+        events, applied = snapshot["counters"]["input_events"], snapshot["counters"]["input_applied"]
+        lines: list[str] = [
+            f"运行 {snapshot['uptime']:.0f} 秒，调度 {frames} 帧，丢帧 {dropped} 帧"
+            + (f"（{dropped / (frames + dropped) * 100:.1f}%）" if frames + dropped else "")
+            + (f"，空闲跳过 {skipped} 帧" if skipped else ""),
+            f"输入事件 {events} 个，合并为 {applied} 次处理",
+            f"帧率档位 {snapshot['gauges']['tier']}，降档 {snapshot['counters']['tier_down']} 次，升档 {snapshot['counters']['tier_up']} 次",
+        ]
+        for name, stats in snapshot["histograms"].items():
+            label: str = self.NAMES.get(name, name)
+            if stats["count"] == 0:
+                lines.append(f"{label}：无数据")
+                continue
+            lines.append(
+                f"{label}：{stats['count']} 次，平均 {stats['mean'] * 1000:.2f} ms，"
+                f"p50 {stats['p50'] * 1000:.2f} / p90 {stats['p90'] * 1000:.2f} / p99 {stats['p99'] * 1000:.2f} ms，"
+                f"最大 {stats['max'] * 1000:.2f} ms"
+            )
+        return "\n".join(lines)
+
+metrics: Metrics = Metrics()
 
 
 # 计算角色素材路径
@@ -120,6 +523,10 @@ def char_path(relative_path: str, path: str | None = None) -> str:
 def char_res_path(relative_path: str, path: str | None = None) -> str:
     return resource_path(char_path(relative_path, path))
 
+def is_char_pack(path: str | None = None) -> bool:
+    """角色路径是角色包文件（否则是角色文件夹）？"""
+    return (config["char"] if path is None else path).endswith(CharPack.SUFFIX)
+
 
 def threshold(img: Image.Image, thr: float = 0xFF, /) -> Image.Image:
     """
@@ -128,91 +535,1492 @@ def threshold(img: Image.Image, thr: float = 0xFF, /) -> Image.Image:
     :param thr: 阈值（不透明度小于阈值 -> 完全透明）
     :return: 图像
     """
-    img = img.copy()
-    alp = img.getchannel("A") # 提取透明度通道
-    alp = alp.point(lambda a: 0x00 if a < thr else 0xFF) # type: ignore 二值化
-    img.putalpha(alp) # 覆盖透明度通道
+    img = img.convert("RGBA") # 复制像素数据
+    img.putalpha(img.getchannel("A").point(threshold_table(thr))) # 按查找表二值化透明度通道
     return img
 
 
-class FloatingImage:
-    def __init__(self, root: tk.Tk) -> None:
-        self.root: tk.Tk = root
-        self.root.title(char_config.get("name", os.path.basename(config["char"])))
-        icon_path = char_config.get("icon")
+@functools.lru_cache(maxsize=8)
+def threshold_table(thr: float) -> list[int]:
+    return [0xFF if alpha >= thr else 0 for alpha in range(0x100)]
+
+
+@dataclass(frozen=True)
+class Frame:
+    """一帧动画：只保存不透明部分的外接矩形，以及它在完整帧中的位置"""
+    image: Image.Image # 裁剪后的图像
+    size: tuple[int, int] # 完整帧的尺寸
+    offset: tuple[int, int] # 裁剪区域左上角在完整帧中的坐标
+    mask: bytes | memoryview # 裁剪后图像的不透明像素位图（每像素1位，高位在前，每行按字节对齐）
+
+    def hit(self, x: int, y: int) -> bool:
+        """
+        判断裁剪区域内的坐标是否落在不透明像素上
+        :param x: 相对裁剪区域左上角的x坐标
+        :param y: 相对裁剪区域左上角的y坐标
+        """
+        width, height = self.image.size
+        if not (0 <= x < width and 0 <= y < height):
+            return False
+        return bool(self.mask[y * ((width + 7) >> 3) + (x >> 3)] >> (7 - (x & 7)) & 1)
+
+
+def alpha_mask(img: Image.Image) -> bytes:
+    """打包透明度已二值化的图像的不透明像素位图"""
+    return img.getchannel("A").convert("1", dither=Image.Dither.NONE).tobytes()
+
+
+def crop_frame(img: Image.Image) -> Frame:
+    """裁去图像四周完全透明的部分"""
+    bbox = img.getbbox(alpha_only=True)
+    if bbox is None: # 完全透明
+        return Frame(Image.new("RGBA", (1, 1), (0, 0, 0, 0)), img.size, (0, 0), b"\x00")
+    image: Image.Image = img.crop(bbox)
+    return Frame(image, img.size, (bbox[0], bbox[1]), alpha_mask(image))
+
+
+def bake_frame(sprite: Sprite, index: int, size: tuple[int, int], resample: Image.Resampling) -> Frame:
+    """缩放图像的第 index 帧并二值化透明度，得到一帧动画"""
+    return crop_frame(sprite.scaled(index, size, resample))
+
+
+def scale_size(size: tuple[int, int], scale: float) -> tuple[int, int]:
+    """按缩放比例计算尺寸（至少 1 像素）"""
+    return (max(round(size[0] * scale), 1), max(round(size[1] * scale), 1))
+
+
+def frame_sizes(size: tuple[int, int], curve: EasingCurve, length: float) -> list[tuple[int, int]]:
+    """
+    按缓动曲线的查找表计算动画每一帧的尺寸
+    :param size: 原始尺寸
+    :param curve: 缓动曲线
+    :param length: 动画时长（帧）
+    :return: 各帧尺寸
+    """
+    sizes: np.ndarray = (np.array(size, dtype=np.float64) * curve.frames(length)).astype(np.int64)
+    return [(int(width), int(height)) for width, height in sizes]
+
+
+def bake_frames(
+    sprite: Sprite, frames: list[list[tuple[int, tuple[int, int]]]], resample: Image.Resampling, workers: int | None = None
+) -> list[list[Frame]]:
+    """
+    在线程池中批量生成多段动画的所有帧（缩放与二值化均在释放GIL的原生代码中进行）
+
+    缓动曲线的尾部很长一段都接近 1，许多帧取整后的尺寸相同，
+    因此 (图像的帧序号, 尺寸) 相同的帧只生成一次，各段动画中的重复帧都是同一个对象
+    :param sprite: 图像
+    :param frames: 每段动画的各帧 (图像的帧序号, 尺寸)
+    :param resample: 缩放算法
+    :param workers: 线程数，默认为CPU核数
+    :return: 每段动画的各帧图像
+    """
+    def bake(index: int, size: tuple[int, int]) -> Frame:
+        return bake_frame(sprite, index, size, resample)
+    with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+        futures: dict[tuple[int, tuple[int, int]], Future[Frame]] = {}
+        for group in frames:
+            for index, size in group:
+                if (index, size) not in futures:
+                    futures[(index, size)] = pool.submit(bake, index, size)
+        return [[futures[(index, size)].result() for index, size in group] for group in frames]
+
+
+def stream_frames(
+    sprite: Sprite, frames: list[tuple[int, tuple[int, int]]], resample: Image.Resampling,
+    workers: int | None = None, cancel: threading.Event | None = None
+) -> Iterator[Frame]:
+    """
+    在线程池中生成各帧并按顺序逐帧返回，同时生成中的帧不超过线程数的两倍，
+    以便边生成边写入，而不必在内存中保留全部帧
+    :param sprite: 图像
+    :param frames: 各帧 (图像的帧序号, 尺寸)
+    :param resample: 缩放算法
+    :param workers: 线程数，默认为CPU核数
+    :param cancel: 设置后放弃尚未开始的帧并抛出 CancelledError
+    """
+    workers = workers or os.cpu_count() or 1
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        pending: deque[Future[Frame]] = deque()
+
+        def next_frame() -> Frame:
+            if cancel is not None and cancel.is_set():
+                for future in pending:
+                    future.cancel()
+                raise CancelledError()
+            return pending.popleft().result()
+
+        for index, size in frames:
+            pending.append(pool.submit(bake_frame, sprite, index, size, resample))
+            if len(pending) >= workers * 2:
+                yield next_frame()
+        while pending:
+            yield next_frame()
+
+
+class Sprite:
+    """
+    角色图像：静态图片只有一帧；动图（GIF/APNG/WebP）由内存中的文件内容按需逐帧解码
+
+    解码后的帧（已二值化透明度）保存在容量有限的LRU中，
+    因此加载动图只需解码第一帧，顺序播放时每帧只需在上一帧的基础上继续解码（线程安全）；
+    各帧时长由后台线程用独立的解码器读取，查询某一时刻的帧时无需等待解码锁；
+    每帧还带有逐级减半的mipmap（较小的级别在首次需要时才生成，同样保存在LRU中），
+    平滑缩小时从不小于目标尺寸的最小一级开始缩放，开销只取决于目标尺寸而非原图尺寸
+    """
+    DEFAULT_DURATION: float = 0.1 # 未指定时长的帧的时长（秒）
+
+    def __init__(self, source: Image.Image, digest: bytes, capacity: int, data: bytes | memoryview | None = None) -> None:
+        """
+        :param source: 图像文件（静态图片则为已二值化的图像）
+        :param digest: 图像内容的哈希值
+        :param capacity: 解码后的帧的容量上限（字节）
+        :param data: 动图的文件内容（用于导出角色包）
+        """
+        self.source: Image.Image = source
+        self.digest: bytes = digest
+        self.capacity: int = capacity
+        self.data: bytes | memoryview | None = data
+        self.count: int = getattr(source, "n_frames", 1) # 帧数
+        self.frames: OrderedDict[int, list[Image.Image]] = OrderedDict() # 各帧的mipmap（[0] 为原尺寸）
+        self.frames_size: int = 0 # LRU中各帧（含mipmap）的总字节数
+        self.ends: list[float] = [] # 已读取的各帧的结束时刻（秒，自第一帧起累计），只追加
+        self.ends_ready: threading.Condition = threading.Condition() # 读取到新的时长时通知
+        self.lock: threading.RLock = threading.RLock()
+        self.size: tuple[int, int] = self.frame(0).size
+        if self.count > 1:
+            threading.Thread(target=self.read_durations, daemon=True).start()
+
+    @classmethod
+    def open(cls, path: str, capacity: int) -> Sprite:
+        """读取图像文件（只解码第一帧）"""
+        with open(path, "rb") as f:
+            data: bytes = f.read()
+        source: Image.Image = Image.open(io.BytesIO(data))
+        if getattr(source, "n_frames", 1) == 1:
+            return cls.from_image(source)
+        return cls(source, hashlib.sha256(data).digest(), capacity, data)
+
+    @classmethod
+    def from_image(cls, image: Image.Image) -> Sprite:
+        """由静态图像构造"""
+        image = threshold(image)
+        digest = hashlib.sha256(f"{image.mode}|{image.size}|".encode())
+        digest.update(image.tobytes())
+        return cls(image, digest.digest(), 0)
+
+    def decode(self, index: int) -> list[Image.Image]:
+        """解码第 index 帧，并读取其时长"""
+        with self.lock:
+            if self.count == 1:
+                image: Image.Image = self.source
+            else:
+                self.source.seek(index)
+                self.source.load()
+                image = threshold(self.source)
+            levels = self.frames.get(index)
+            if levels is None:
+                levels = self.frames[index] = [image]
+                self.frames_size += image.size[0] * image.size[1] * 4
+                while self.frames_size > self.capacity and len(self.frames) > 1:
+                    _, old = self.frames.popitem(last=False)
+                    self.frames_size -= sum(level.size[0] * level.size[1] * 4 for level in old)
+            return levels
+
+    def levels(self, index: int) -> list[Image.Image]:
+        """第 index 帧的mipmap（[0] 为原尺寸，其后逐级减半）"""
+        with self.lock:
+            levels = self.frames.get(index)
+            if levels is not None:
+                self.frames.move_to_end(index)
+                return levels
+            return self.decode(index)
+
+    def frame(self, index: int) -> Image.Image:
+        """第 index 帧（已二值化透明度）"""
+        return self.levels(index)[0]
+
+    def level(self, index: int, size: tuple[int, int]) -> Image.Image:
+        """第 index 帧的mipmap中不小于 size 的最小一级（尚未生成时逐级生成）"""
+        with self.lock:
+            levels = self.levels(index)
+            while True:
+                width, height = levels[-1].size
+                if width < size[0] * 2 or height < size[1] * 2 or min(width, height) < 2:
+                    break
+                level: Image.Image = levels[-1].reduce(2)
+                levels.append(level)
+                if self.frames.get(index) is levels:
+                    self.frames_size += level.size[0] * level.size[1] * 4
+            # 放大时只能使用原尺寸
+            return next((level for level in reversed(levels) if level.size[0] >= size[0] and level.size[1] >= size[1]), levels[0])
+
+    def scaled(self, index: int, size: tuple[int, int], resample: Image.Resampling) -> Image.Image:
+        """
+        第 index 帧缩放至 size 并二值化透明度（尺寸不变时直接返回原帧）
+        最近邻缩放的开销本就只取决于目标尺寸，因此只有平滑缩放才使用mipmap
+        """
+        if size == self.size:
+            return self.frame(index)
+        source: Image.Image = self.frame(index) if resample == Image.Resampling.NEAREST else self.level(index, size)
+        return threshold(source.resize(size, resample))
+
+    def read_durations(self) -> None:
+        """依次读取各帧时长（在后台线程中运行，使用独立的解码器，不占用解码锁）"""
         try:
-            if icon_path is not None:
-                self.root.iconbitmap(char_res_path(icon_path))
+            reader: Image.Image = Image.open(io.BytesIO(self.data or b""))
+            for index in range(self.count):
+                reader.seek(index)
+                if reader.format == "WEBP": # WebP 的帧时长在解码时才读取
+                    reader.load()
+                duration = reader.info.get("duration")
+                self.add_duration(duration / 1000 if duration else self.DEFAULT_DURATION)
+        except Exception as e:
+            print(e)
+        while len(self.ends) < self.count: # 无法读取时长的帧按默认时长播放
+            self.add_duration(self.DEFAULT_DURATION)
+
+    def add_duration(self, duration: float) -> None:
+        with self.ends_ready:
+            self.ends.append((self.ends[-1] if self.ends else 0.0) + duration)
+            self.ends_ready.notify_all()
+
+    def locate(self, t: float) -> tuple[int, float]:
+        """
+        循环播放时，第 t 秒显示的帧：在各帧的结束时刻中二分查找，无需加锁；
+        时长尚未读取到第 t 秒时等待后台线程读取（远快于播放，通常无需等待）
+        :return: 帧序号, 距下一帧的时间（秒）
+        """
+        if self.count == 1:
+            return 0, float("inf")
+        ends: list[float] = self.ends
+        if len(ends) < self.count and (not ends or t >= ends[-1]):
+            with self.ends_ready:
+                self.ends_ready.wait_for(lambda: len(ends) == self.count or bool(ends) and t < ends[-1])
+        if len(ends) == self.count:
+            t %= ends[-1]
+        index: int = bisect.bisect_right(ends, t)
+        return index, ends[index] - t
+
+
+class LazyFrames:
+    """
+    按需生成的动画帧序列，可像列表一样按下标取帧
+
+    帧在首次访问时生成，并保存在容量有限的LRU中；
+    每次取帧后，后台线程会预先生成随后的若干帧
+    """
+    PREFETCH: int = 4 # 预取帧数
+
+    def __init__(self, render: Callable[[int], Frame], length: int, capacity: int, pool: ThreadPoolExecutor) -> None:
+        """
+        :param render: 生成第 i 帧的函数（须线程安全）
+        :param length: 帧数
+        :param capacity: LRU容量上限（字节）
+        :param pool: 执行预取的线程池
+        """
+        self.render: Callable[[int], Frame] = render
+        self.length: int = length
+        self.capacity: int = capacity
+        self.pool: ThreadPoolExecutor = pool
+        self.frames: OrderedDict[int, Frame] = OrderedDict()
+        self.pending: dict[int, Future[Frame]] = {}
+        self.size: int = 0 # LRU中各帧的总字节数
+        self.lock: threading.RLock = threading.RLock()
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __getitem__(self, index: int) -> Frame:
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError(index)
+        with self.lock:
+            frame = self.frames.get(index)
+            if frame is not None:
+                self.frames.move_to_end(index)
+            future = self.pending.get(index)
+        if frame is None:
+            frame = future.result() if future is not None else self.render(index)
+            self.put(index, frame)
+        self.prefetch(index + 1)
+        return frame
+
+    def put(self, index: int, frame: Frame) -> None:
+        """将帧放入LRU，并淘汰最久未访问的帧"""
+        with self.lock:
+            if index in self.frames:
+                return
+            self.frames[index] = frame
+            self.size += frame.image.size[0] * frame.image.size[1] * 4
+            while self.size > self.capacity and len(self.frames) > 1:
+                _, old = self.frames.popitem(last=False)
+                self.size -= old.image.size[0] * old.image.size[1] * 4
+
+    def prefetch(self, start: int) -> None:
+        """在后台预先生成从第 start 帧起的若干帧"""
+        with self.lock:
+            for index in range(start, min(start + self.PREFETCH, self.length)):
+                if index in self.frames or index in self.pending:
+                    continue
+                try:
+                    future = self.pool.submit(self.render, index)
+                except RuntimeError: # 线程池已关闭
+                    return
+                self.pending[index] = future
+                future.add_done_callback(lambda f, i=index: self.on_prefetched(i, f))
+
+    def on_prefetched(self, index: int, future: Future[Frame]) -> None:
+        with self.lock:
+            self.pending.pop(index, None)
+        if not future.cancelled() and future.exception() is None:
+            self.put(index, future.result())
+
+    def clear(self) -> None:
+        with self.lock:
+            for future in list(self.pending.values()): # 取消时会立即回调 on_prefetched
+                future.cancel()
+            self.pending.clear()
+            self.frames.clear()
+            self.size = 0
+
+
+class PhotoCache:
+    """
+    Tk图像缓存（仅可在Tk线程中使用）
+
+    每帧只转换一次为 PhotoImage 并重复使用，同时统计转换与复用的耗时
+    """
+    def __init__(self, capacity: int) -> None:
+        """
+        :param capacity: 容量上限（字节）
+        """
+        self.capacity: int = capacity
+        self.photos: OrderedDict[Hashable, ImageTk.PhotoImage] = OrderedDict()
+        self.size: int = 0
+        self.convert_count: int = 0 # 转换次数
+        self.convert_time: float = 0.0 # 转换总耗时（秒）
+        self.hit_count: int = 0 # 复用次数
+        self.hit_time: float = 0.0 # 复用总耗时（秒）
+
+    def get(self, key: Hashable, image: Image.Image) -> ImageTk.PhotoImage:
+        """取得 key 对应的 PhotoImage，不存在时由 image 转换而来"""
+        start: float = time.perf_counter()
+        photo = self.photos.get(key)
+        if photo is not None:
+            self.photos.move_to_end(key)
+            self.hit_count += 1
+            self.hit_time += time.perf_counter() - start
+            return photo
+        photo = ImageTk.PhotoImage(image)
+        self.photos[key] = photo
+        self.size += photo.width() * photo.height() * 4
+        while self.size > self.capacity and len(self.photos) > 1:
+            _, old = self.photos.popitem(last=False)
+            self.size -= old.width() * old.height() * 4
+        self.convert_count += 1
+        self.convert_time += time.perf_counter() - start
+        return photo
+
+    def clear(self) -> None:
+        self.photos.clear()
+        self.size = 0
+
+    def report(self) -> str:
+        """统计复用 PhotoImage 为Tk线程节省的时间"""
+        if self.convert_count == 0:
+            return "尚未转换任何帧"
+        convert_avg: float = self.convert_time / self.convert_count
+        hit_avg: float = self.hit_time / self.hit_count if self.hit_count else 0.0
+        saved: float = (convert_avg - hit_avg) * self.hit_count
+        return (
+            f"转换 {self.convert_count} 帧，平均 {convert_avg * 1000:.3f} ms/帧；"
+            f"复用 {self.hit_count} 次，平均 {hit_avg * 1000:.3f} ms/帧；"
+            f"共节省 {saved * 1000:.1f} ms"
+        )
+
+
+class FrameScheduler:
+    """
+    帧调度器：所有动画共用的帧时钟
+
+    使用单调时钟，每一帧都对齐到帧截止时间，并依据实际唤醒时间补偿 after() 的抖动；
+    任务收到的是名义帧时间（截止时间），因此唤醒的早晚不会导致重复帧或跳帧，
+    错过一整帧以上时则跳过错过的帧并计入丢帧数；
+    任务可以返回下次需要执行的时刻，在此之前的帧不再执行该任务，
+    所有任务都不需要执行的帧直接跳过，不唤醒主线程（跳过的帧不计入丢帧）
+    """
+    def __init__(self, root: tk.Misc, fps: int) -> None:
+        self.root: tk.Misc = root
+        self.period: float = 1 / fps # 帧间隔（秒）
+        self.tasks: dict[Hashable, Callable[[float], bool | float]] = {} # 任务返回 False 时将被移除
+        self.due: dict[Hashable, float] = {} # 任务下次需要执行的时刻（没有记录的任务每帧执行）
+        self.deadline: float = 0.0 # 下一帧的截止时间
+        self.after_id: str | None = None
+        self.ticking: bool = False
+        self.frame_count: int = 0 # 已调度帧数
+        self.dropped_count: int = 0 # 丢帧数
+        self.governor: FrameGovernor | None = None # 每帧向其报告迟到时间与主线程耗时
+
+    @staticmethod
+    def now() -> float:
+        return time.perf_counter()
+
+    def add(self, key: Hashable, task: Callable[[float], bool | float], immediate: bool = True) -> None:
+        """
+        添加任务（同名任务将被替换）
+        :param key: 任务名
+        :param task: 任务，参数为名义帧时间，返回 True 表示下一帧继续执行，False 表示移除，
+                     返回时刻则表示到该时刻时再执行
+        :param immediate: 是否立即执行一次（否则从下一帧开始执行）
+        """
+        self.tasks[key] = task
+        self.due.pop(key, None)
+        if immediate and not self.run(key, task, self.now()):
+            return
+        if self.ticking:
+            return
+        next_deadline: float = self.now() + self.period
+        if self.after_id is None:
+            self.deadline = next_deadline
+            self.schedule()
+        elif self.deadline > next_deadline and self.due.get(key, 0.0) < self.deadline:
+            # 正在跳过空闲的帧，而新任务需要更早执行
+            self.root.after_cancel(self.after_id)
+            self.deadline = next_deadline
+            self.schedule()
+
+    def remove(self, key: Hashable, task: Callable[[float], bool | float] | None = None) -> None:
+        """移除任务（若指定 task，则仅当该任务仍在执行时移除）"""
+        if task is None or self.tasks.get(key) is task:
+            self.tasks.pop(key, None)
+            self.due.pop(key, None)
+
+    def run(self, key: Hashable, task: Callable[[float], bool | float], frame_time: float) -> bool:
+        """
+        执行一次任务并记录其下次需要执行的时刻
+        :return: 任务是否继续执行
+        """
+        result: bool | float = task(frame_time)
+        if result is False:
+            self.remove(key, task)
+            return False
+        if self.tasks.get(key) is task:
+            if result is True:
+                self.due.pop(key, None)
             else:
-                self.root.iconphoto(True, tk.PhotoImage(char_config["image"]))
-        except tk.TclError: pass
-        self.root.overrideredirect(True) # 无边框
-        self.root.resizable(False, False) # 禁止缩放
-        self.root.attributes('-topmost', config["topmost"]) # 最上层显示
-        if os.name == 'nt':  # Windows系统
-            self.root.attributes('-transparentcolor', char_config["miyu_color"]) # 透明色（根据图片调整）
+                self.due[key] = result
+        return True
+
+    def schedule(self) -> None:
+        """在下一帧截止时间唤醒"""
+        delay: int = max(int((self.deadline - self.now()) * 1000), 0)
+        self.after_id = self.root.after(delay, self.tick)
+
+    def tick(self) -> None:
+        self.after_id = None
+        now: float = self.now()
+        lateness: float = now - self.deadline
+        missed: int = int(lateness / self.period) # 错过的整帧数
+        if missed > 0:
+            self.dropped_count += missed
+            self.deadline += missed * self.period
+            metrics.count("dropped_frames", missed)
+        self.frame_count += 1
+        metrics.count("frames")
+
+        self.ticking = True
+        try:
+            for key, task in list(self.tasks.items()):
+                if self.tasks.get(key) is not task: # 已被其他任务替换或移除
+                    continue
+                if self.due.get(key, 0.0) > self.deadline: # 尚未到下次需要执行的时刻
+                    continue
+                self.run(key, task, self.deadline)
+        finally:
+            self.ticking = False
+        busy: float = self.now() - now
+        metrics.record("frame_busy", busy)
+        if self.governor is not None:
+            self.governor.observe(lateness, busy, self.period)
+
+        if self.tasks:
+            self.deadline += self.period
+            if len(self.due) == len(self.tasks): # 所有任务都有下次执行的时刻：直接跳到最早的那一帧
+                skipped: int = math.ceil((min(self.due.values()) - self.deadline) / self.period - 1e-9)
+                if skipped > 0:
+                    self.deadline += skipped * self.period
+                    metrics.count("skipped_frames", skipped)
+            self.schedule()
+
+    def stop(self) -> None:
+        self.tasks.clear()
+        self.due.clear()
+        if self.after_id is not None:
+            self.root.after_cancel(self.after_id)
+            self.after_id = None
+
+    def report(self) -> str:
+        return f"调度 {self.frame_count} 帧，丢帧 {self.dropped_count} 帧"
+
+
+@dataclass(eq=False)
+class PackedSound:
+    """角色包中的音效：预解码的PCM（混音器格式相同时直接使用），以及用于回退的原始音频文件内容"""
+    pcm: bytes | memoryview
+    format: tuple[int, int, int] | None # PCM的 采样率, 采样格式, 声道数（未预解码时为 None）
+    data: bytes | memoryview
+
+
+# 音效来源：音效文件路径，或角色包中的音效
+SoundSource = str | PackedSound
+
+
+class FrameGovernor:
+    """
+    自适应帧率调节器
 
-        # 初始化音效
-        pygame.mixer.init()
-        self.sound: pygame.mixer.Sound = pygame.mixer.Sound(char_res_path(char_config["sound"]))
+    每帧的开销记为迟到时间（实际唤醒晚于截止时间多少）与主线程执行各任务的耗时之和，
+    每个统计窗口结束时评估一次：平均开销超出帧间隔的一定比例就降一档；
+    连续若干个窗口的平均开销都明显低于上一档的帧间隔时才升一档，避免在两档之间来回振荡；
+    只降低帧率而不改变动画帧：动画帧已预先生成，换用其他缩放算法并不减少显示时的开销，
+    反而要在主线程上重新生成与转换动画帧
+    """
+    TIERS: tuple[int, ...] = (1, 2, 3) # 各档的帧间隔倍数，依次降低
+    WINDOW: int = 30 # 每个统计窗口的帧数
+    OVERLOAD: float = 0.75 # 平均开销超过帧间隔的该比例时降档
+    HEADROOM: float = 0.5 # 平均开销低于上一档帧间隔的该比例时视为有余量
+    RECOVER: int = 4 # 连续有余量的窗口数达到该值时升档
+
+    def __init__(self, on_change: Callable[[], None]) -> None:
+        """
+        :param on_change: 档位变化时的回调
+        """
+        self.on_change: Callable[[], None] = on_change
+        self.enabled: bool = True
+        self.tier: int = 0
+        self.frames: int = 0 # 本窗口的帧数
+        self.cost: float = 0.0 # 本窗口的总开销（秒）
+        self.good_windows: int = 0 # 连续有余量的窗口数
+
+    @property
+    def stride(self) -> int:
+        """帧间隔倍数（每隔几帧显示一帧）"""
+        return self.TIERS[self.tier]
+
+    def describe(self) -> str:
+        if self.tier == 0:
+            return "第 0 档（全帧率）"
+        return f"第 {self.tier} 档（1/{self.stride} 帧率）"
+
+    def observe(self, lateness: float, busy: float, period: float) -> None:
+        """
+        记录一帧的开销
+        :param lateness: 迟到时间（秒）
+        :param busy: 主线程执行各任务的耗时（秒）
+        :param period: 当前帧间隔（秒）
+        """
+        if not self.enabled:
+            return
+        self.frames += 1
+        self.cost += max(lateness, 0.0) + busy
+        if self.frames < self.WINDOW:
+            return
+        cost: float = self.cost / self.frames
+        self.frames = 0
+        self.cost = 0.0
+        if cost > period * self.OVERLOAD and self.tier < len(self.TIERS) - 1:
+            self.good_windows = 0
+            self.set_tier(self.tier + 1)
+        elif self.tier > 0 and cost < period / self.stride * self.TIERS[self.tier - 1] * self.HEADROOM:
+            self.good_windows += 1
+            if self.good_windows >= self.RECOVER:
+                self.good_windows = 0
+                self.set_tier(self.tier - 1)
+        else:
+            self.good_windows = 0
 
-        # 初始化图片
-        self.load_image()
+    def set_tier(self, tier: int) -> None:
+        if tier == self.tier:
+            return
+        metrics.count("tier_down" if tier > self.tier else "tier_up")
+        metrics.set("tier", tier)
+        self.tier = tier
+        self.frames = 0
+        self.cost = 0.0
+        self.on_change()
+
+
+class AudioEngine:
+    """
+    音效引擎：由常驻工作线程初始化混音器、加载音效，并从队列中取出请求
+
+    不可叠加的音效独占保留声道，新音效直接打断旧音效；
+    可叠加的音效使用其余声道，声道用尽时抢占最早开始播放的声道；
+    pygame 只在工作线程中导入与初始化，不会拖慢窗口的显示
+    """
+    def __init__(self, buffer: int, voices: int) -> None:
+        """
+        :param buffer: 混音器缓冲区大小（采样数）
+        :param voices: 声道数
+        """
+        self.buffer: int = buffer
+        self.voices: int = voices
+        self.buffer_latency: float = 0.0 # 缓冲区带来的延迟（秒），混音器初始化后才能确定
+        # 请求：(类型 "load" / "play", 音效来源, 可叠加？, 触发时刻)，或在工作线程中执行的函数
+        self.queue: queue.SimpleQueue[tuple[str, SoundSource, bool, float] | Callable[[], None] | None] = queue.SimpleQueue()
+        self.sounds: dict[SoundSource, pygame.mixer.Sound] = {} # 已加载的音效（仅在工作线程中访问）
+        self.latency_count: int = 0
+        self.latency_total: float = 0.0 # 从请求到开始播放的总耗时（秒）
+        self.latency_max: float = 0.0
+        self.thread: threading.Thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def load(self, source: SoundSource) -> None:
+        """请求（重新）加载音效（立即返回），文件变化后须重新加载"""
+        self.queue.put(("load", source, False, 0.0))
+
+    def play(self, source: SoundSource, echo: bool, since: float | None = None) -> None:
+        """
+        请求播放音效（立即返回），尚未加载的音效会先加载
+        :param source: 音效文件路径或角色包中的音效
+        :param echo: 是否与正在播放的音效叠加
+        :param since: 触发播放的时刻（用于统计延迟），默认为当前时刻
+        """
+        self.queue.put(("play", source, echo, time.perf_counter() if since is None else since))
+
+    def decode(self, path: str) -> Future[tuple[tuple[int, int, int], bytes]]:
+        """
+        请求将音效文件解码为混音器格式的PCM（在工作线程中进行）
+        :param path: 音效文件路径
+        :return: (采样率, 采样格式, 声道数), PCM
+        """
+        future: Future[tuple[tuple[int, int, int], bytes]] = Future()
+
+        def decode() -> None:
+            import pygame
+            try:
+                mixer_format = pygame.mixer.get_init()
+                if not mixer_format:
+                    raise RuntimeError("混音器不可用")
+                future.set_result((mixer_format, pygame.mixer.Sound(path).get_raw()))
+            except Exception as e:
+                future.set_exception(e)
+
+        self.queue.put(decode)
+        return future
+
+    def run(self) -> None:
+        import pygame
+        try:
+            pygame.mixer.init(buffer=self.buffer)
+            pygame.mixer.set_num_channels(max(self.voices - 1, 1))
+            frequency, _, _ = pygame.mixer.get_init()
+            self.buffer_latency = self.buffer / frequency
+            ready: bool = True
+        except pygame.error as e:
+            print(e)
+            ready = False # 没有可用的音频设备时丢弃所有请求
+
+        # 不可叠加的音效每种各占一个保留声道：再次播放时只打断同一种音效，与其他角色的音效互不影响
+        solos: dict[SoundSource, pygame.mixer.Channel] = {}
+
+        def solo_channel(source: SoundSource) -> pygame.mixer.Channel:
+            channel = solos.get(source)
+            if channel is None:
+                pygame.mixer.set_num_channels(max(self.voices - 1, 1) + len(solos) + 1)
+                pygame.mixer.set_reserved(len(solos) + 1) # 前若干个声道不参与 find_channel
+                channel = solos[source] = pygame.mixer.Channel(len(solos))
+            return channel
+
+        def load(source: SoundSource) -> pygame.mixer.Sound | None:
+            try:
+                if isinstance(source, str):
+                    self.sounds[source] = pygame.mixer.Sound(source)
+                elif source.format == pygame.mixer.get_init(): # 预解码的PCM可直接使用
+                    self.sounds[source] = pygame.mixer.Sound(buffer=source.pcm)
+                else: # 混音器格式不同时改为解码原始文件
+                    self.sounds[source] = pygame.mixer.Sound(file=io.BytesIO(source.data))
+            except (pygame.error, FileNotFoundError) as e: # 加载失败时保留旧的音效
+                print(e)
+            return self.sounds.get(source)
+
+        while True:
+            request = self.queue.get()
+            if request is None:
+                break
+            # 合并积压的请求：不可叠加的音效只需播放最后一次
+            requests = [request]
+            closing: bool = False
+            while not self.queue.empty():
+                request = self.queue.get()
+                if request is None:
+                    closing = True
+                    break
+                requests.append(request)
+            if closing:
+                break
+            for request in requests:
+                if callable(request):
+                    request()
+            if not ready:
+                continue
+            last_solo: dict[SoundSource, int] = { # 每种不可叠加的音效最后一次播放请求
+                request[1]: i for i, request in enumerate(requests)
+                if not callable(request) and request[0] == "play" and not request[2]
+            }
+            for i, request in enumerate(requests):
+                if callable(request):
+                    continue
+                kind, source, echo, since = request
+                if kind == "load":
+                    load(source)
+                    continue
+                if not echo and i != last_solo[source]:
+                    continue
+                sound = self.sounds.get(source)
+                if sound is None:
+                    sound = load(source)
+                if sound is None:
+                    continue
+                try:
+                    if echo:
+                        channel = pygame.mixer.find_channel(True) # 抢占最早开始播放的声道
+                        if channel is not None:
+                            channel.play(sound)
+                    else:
+                        solo_channel(source).play(sound)
+                except pygame.error as e:
+                    print(e)
+                    continue
+                latency = time.perf_counter() - since
+                metrics.record("press_to_sound", latency)
+                self.latency_count += 1
+                self.latency_total += latency
+                self.latency_max = max(self.latency_max, latency)
+        self.sounds.clear()
+        pygame.mixer.quit()
+
+    def close(self) -> None:
+        self.queue.put(None)
+        self.thread.join(timeout=1)
+
+    def report(self) -> str:
+        if self.latency_count == 0:
+            return "尚未播放音效"
+        return (
+            f"播放音效 {self.latency_count} 次，"
+            f"触发至播放平均 {self.latency_total / self.latency_count * 1000:.2f} ms，"
+            f"最大 {self.latency_max * 1000:.2f} ms（另有缓冲区延迟 {self.buffer_latency * 1000:.2f} ms）"
+        )
+
+
+class FrameAtlas:
+    """
+    动画帧图集：所有帧裁剪后依次紧凑地存放在同一个像素数组中
+
+    每帧只占用其不透明部分的外接矩形，且像素连续存放，
+    因此取帧时得到的是图集的视图而非副本；各帧的不透明像素位图同样连续存放在像素之后；
+    键相同的帧只存放一次，各自的记录指向同一段像素；
+    像素数组可直接写入文件，也可由内存映射的文件直接构造
+    """
+    MAGIC: bytes = b"QATL"
+    HEADER: struct.Struct = struct.Struct("<4sIQQ")
+    # 每帧的记录：像素起始位置, 裁剪宽, 裁剪高, 偏移x, 偏移y, 完整宽, 完整高, 位图起始位置
+    BOX_FIELDS: int = 8
+
+    def __init__(self, pixels: np.ndarray, boxes: np.ndarray, masks: np.ndarray) -> None:
+        """
+        :param pixels: 图集像素（一维）
+        :param boxes: 各帧记录 (帧数, 8)
+        :param masks: 各帧的不透明像素位图（一维）
+        """
+        self.pixels: np.ndarray = pixels
+        self.boxes: np.ndarray = boxes
+        self.masks: np.ndarray = masks
+
+    def __len__(self) -> int:
+        return len(self.boxes)
+
+    @classmethod
+    def write_frames(cls, f: BinaryIO, keys: Sequence[Hashable], frames: Iterator[Frame]) -> None:
+        """
+        边生成边写入图集：像素逐帧写入文件，内存中只保留各帧记录与不透明像素位图
+        :param f: 可定位的文件，图集写入当前位置
+        :param keys: 各帧的键，键相同的帧内容相同
+        :param frames: 依次生成每个不同的键（按首次出现的顺序）对应的帧
+        """
+        base: int = f.tell()
+        boxes: np.ndarray = np.zeros((len(keys), cls.BOX_FIELDS), dtype="<i8")
+        f.seek(base + cls.HEADER.size + boxes.nbytes) # 先写像素，记录与文件头最后补写
+        rows: dict[Hashable, tuple[int, ...]] = {}
+        masks: list[bytes] = []
+        start: int = 0
+        mask_start: int = 0
+        for index, key in enumerate(keys):
+            if key not in rows:
+                frame: Frame = next(frames)
+                crop_w, crop_h = frame.image.size
+                f.write(frame.image.convert("RGBA").tobytes())
+                masks.append(bytes(frame.mask))
+                rows[key] = (start, crop_w, crop_h, *frame.offset, *frame.size, mask_start)
+                start += crop_w * crop_h * 4
+                mask_start += len(frame.mask)
+            boxes[index] = rows[key]
+        for mask in masks:
+            f.write(mask)
+        end: int = f.tell()
+        f.seek(base)
+        f.write(cls.HEADER.pack(cls.MAGIC, len(keys), start, mask_start))
+        f.write(boxes.tobytes())
+        f.seek(end)
+
+    def frame(self, index: int) -> Frame:
+        start, crop_w, crop_h, offset_x, offset_y, width, height, mask_start = (int(v) for v in self.boxes[index])
+        view: np.ndarray = self.pixels[start:start + crop_w * crop_h * 4]
+        return Frame(
+            Image.frombuffer("RGBA", (crop_w, crop_h), view, "raw", "RGBA", 0, 1), # type: ignore
+            (width, height), (offset_x, offset_y),
+            memoryview(self.masks[mask_start:mask_start + ((crop_w + 7) >> 3) * crop_h])
+        )
+
+    @property
+    def nbytes(self) -> int:
+        return self.pixels.nbytes + self.boxes.nbytes + self.masks.nbytes
+
+    @property
+    def unique_count(self) -> int:
+        """不同的帧数（重复的帧共用同一段像素）"""
+        return len(np.unique(self.boxes[:, 0]))
+
+    def write(self, f: BinaryIO) -> None:
+        f.write(self.HEADER.pack(self.MAGIC, len(self.boxes), self.pixels.nbytes, self.masks.nbytes))
+        f.write(self.boxes.astype("<i8").tobytes())
+        f.write(self.pixels.tobytes())
+        f.write(self.masks.tobytes())
+
+    @classmethod
+    def from_buffer(cls, buffer: Any, offset: int = 0) -> tuple["FrameAtlas", int]:
+        """
+        由缓冲区（如内存映射的文件）构造图集，不复制像素数据
+        :return: 图集, 图集之后的偏移
+        """
+        magic, count, length, mask_length = cls.HEADER.unpack_from(buffer, offset)
+        if magic != cls.MAGIC:
+            raise ValueError("图集格式不匹配")
+        offset += cls.HEADER.size
+        boxes = np.frombuffer(buffer, dtype="<i8", count=count * cls.BOX_FIELDS, offset=offset).reshape(count, cls.BOX_FIELDS)
+        offset += boxes.nbytes
+        pixels = np.frombuffer(buffer, dtype=np.uint8, count=length, offset=offset)
+        offset += pixels.nbytes
+        masks = np.frombuffer(buffer, dtype=np.uint8, count=mask_length, offset=offset)
+        offset += masks.nbytes
+        return cls(pixels, boxes, masks), offset
+
+
+class FrameCache:
+    """
+    动画帧磁盘缓存
+
+    以 立绘内容（动图则为文件内容） 与 影响动画帧的全部配置项 的哈希值作为键，
+    任一输入改变都会得到新的键，旧缓存则随容量淘汰自然失效；
+    缓存文件是按下动画与释放动画的帧数加上图集，读取时直接内存映射
+    """
+    VERSION: int = 4
+    MAGIC: bytes = b"QFRM"
+    HEADER: struct.Struct = struct.Struct("<4sIII")
+    SUFFIX: str = ".frames"
+    TEMP_STALE: float = 600 # 临时文件超过该时长（秒）未写入即视为残留
+
+    def __init__(self, path: str, capacity: int) -> None:
+        """
+        :param path: 缓存文件夹
+        :param capacity: 容量上限（字节）
+        """
+        self.path: str = path
+        self.capacity: int = capacity
+
+    @classmethod
+    def key(cls, sprite: Sprite, fps: int, cfg: CharConfig, scale: float) -> str:
+        """计算缓存键"""
+        digest = hashlib.sha256()
+        digest.update(f"{cls.VERSION}|{sprite.size}|{sprite.count}|{fps}|{scale!r}".encode())
+        digest.update(f"|{cfg['factor']!r}|{cfg['duration']!r}|{cfg['duration_active']!r}".encode())
+        digest.update(f"|{cfg.get('smooth', True)!r}|{char_curves(cfg)[0].axes!r}|{char_curves(cfg)[1].axes!r}|".encode())
+        digest.update(sprite.digest)
+        return digest.hexdigest()
+
+    def file_path(self, key: str) -> str:
+        return os.path.join(self.path, key + self.SUFFIX)
+
+    def load(self, key: str) -> tuple[FrameAtlas, int, int] | None:
+        """
+        内存映射地读取缓存，未命中或缓存损坏时返回 None
+        :return: 图集, 按下动画帧数, 释放动画帧数
+        """
+        path = self.file_path(key)
+        try:
+            with open(path, "rb") as f:
+                buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, version, count_press, count_release = self.HEADER.unpack_from(buffer, 0)
+            if magic != self.MAGIC or version != self.VERSION:
+                raise ValueError("缓存格式不匹配")
+            atlas, end = FrameAtlas.from_buffer(buffer, self.HEADER.size)
+            if end != len(buffer) or len(atlas) != count_press + count_release:
+                raise ValueError("缓存文件不完整")
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(e)
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+        try:
+            os.utime(path) # 刷新访问时间，供淘汰时参考
+        except OSError:
+            pass
+        return atlas, count_press, count_release
+
+    def store(
+        self, key: str, count_press: int, count_release: int, write: Callable[[BinaryIO], None]
+    ) -> FrameAtlas | None:
+        """
+        写入缓存（先写临时文件再替换，避免残缺文件）并内存映射地读回，随后按容量淘汰旧缓存
+        :param write: 将图集写入文件
+        :return: 内存映射的图集，写入失败时返回 None
+        """
+        path = self.file_path(key)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            with open(temp_path, "wb") as f:
+                f.write(self.HEADER.pack(self.MAGIC, self.VERSION, count_press, count_release))
+                write(f)
+            os.replace(temp_path, path)
+        except Exception as e:
+            if not isinstance(e, CancelledError): # 退出时取消生成不是错误
+                print(e)
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            return None
+        cached = self.load(key) # 先映射再淘汰：即使超出容量被删除，映射仍然有效
+        self.evict()
+        return cached[0] if cached is not None else None
+
+    def evict(self) -> None:
+        """
+        淘汰最久未使用的缓存，直至总大小不超过容量上限；
+        同时删除长时间未写入的临时文件（写入中途进程被终止时留下的）
+        """
+        entries: list[tuple[float, int, str]] = []
+        stale: float = time.time() - self.TEMP_STALE
+        try:
+            with os.scandir(self.path) as it:
+                for entry in it:
+                    if not entry.is_file():
+                        continue
+                    stat = entry.stat()
+                    if entry.name.endswith(self.SUFFIX):
+                        entries.append((stat.st_mtime, stat.st_size, entry.path))
+                    elif entry.name.endswith(".tmp") and self.SUFFIX in entry.name and stat.st_mtime < stale:
+                        try:
+                            os.remove(entry.path)
+                        except OSError:
+                            pass
+        except OSError:
+            return
+        total: int = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.capacity:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+
+class CharPack:
+    """
+    角色包：角色配置、图像像素、预生成的动画帧与预解码的音效存放在同一个文件中
+
+    文件头之后是各段的目录（段名, 偏移, 长度），各段按 64 字节对齐；
+    打开时只需内存映射文件并读取文件头与目录，图像像素、图集与PCM都直接引用映射的内存而不复制
+    """
+    SUFFIX: str = ".qchar"
+    MAGIC: bytes = b"QCHR"
+    VERSION: int = 1
+    ALIGN: int = 64
+    HEADER: struct.Struct = struct.Struct("<4sII") # 标识, 版本, 段数
+    SECTION: struct.Struct = struct.Struct("<16sQQ") # 段名, 偏移, 长度
+    # 图像段：格式（b"RAW " 为二值化后的RGBA像素，b"FILE" 为动图文件内容）, 宽, 高, 图像内容的哈希值
+    SPRITE: struct.Struct = struct.Struct("<4sII32s")
+    FRAMES: struct.Struct = struct.Struct("<64sII") # 动画帧段：缓存键, 按下动画帧数, 释放动画帧数；之后是图集
+    SOUND: struct.Struct = struct.Struct("<iii") # 音效段：采样率, 采样格式, 声道数；之后是PCM
+
+    def __init__(self, path: str) -> None:
+        """
+        内存映射地打开角色包
+        :param path: 角色包文件路径
+        """
+        with open(path, "rb") as f:
+            self.buffer: mmap.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, count = self.HEADER.unpack_from(self.buffer, 0)
+        if magic != self.MAGIC or version != self.VERSION:
+            raise ValueError("角色包格式不匹配")
+        view: memoryview = memoryview(self.buffer)
+        self.sections: dict[str, memoryview] = {}
+        for index in range(count):
+            name, offset, length = self.SECTION.unpack_from(self.buffer, self.HEADER.size + index * self.SECTION.size)
+            if offset + length > len(self.buffer):
+                raise ValueError("角色包不完整")
+            self.sections[name.rstrip(b"\0").decode()] = view[offset:offset + length]
+        self.config: dict[str, Any] = json.loads(bytes(self.sections["config"]))
+
+    def sprite(self, name: str, capacity: int) -> Sprite | None:
+        """
+        读取图像（每次调用都得到独立的解码器）
+        :param name: 段名 "image" / "image_active"
+        :param capacity: 动图解码后的帧的容量上限（字节）
+        """
+        section = self.sections.get(name)
+        if section is None:
+            return None
+        kind, width, height, digest = self.SPRITE.unpack_from(section)
+        data: memoryview = section[self.SPRITE.size:]
+        if kind == b"RAW ":
+            return Sprite(Image.frombuffer("RGBA", (width, height), data, "raw", "RGBA", 0, 1), digest, 0) # type: ignore
+        return Sprite(Image.open(io.BytesIO(data)), digest, capacity, data)
+
+    def atlas(self, key: str) -> FrameAtlas | None:
+        """预生成的图集（缓存键不同，即帧率等配置与导出时不同时返回 None）"""
+        section = self.sections.get("frames")
+        if section is None:
+            return None
+        stored_key, count_press, count_release = self.FRAMES.unpack_from(section)
+        if stored_key.decode() != key:
+            return None
+        atlas, _ = FrameAtlas.from_buffer(section, self.FRAMES.size)
+        return atlas if len(atlas) == count_press + count_release else None
+
+    @functools.cached_property
+    def sound(self) -> PackedSound | None:
+        section = self.sections.get("sound")
+        data: memoryview = self.sections.get("sound_file", memoryview(b""))
+        if section is None:
+            return PackedSound(b"", None, data) if data else None
+        return PackedSound(section[self.SOUND.size:], self.SOUND.unpack_from(section), data)
+
+    @property
+    def icon(self) -> memoryview | None:
+        """托盘图标文件内容"""
+        return self.sections.get("icon")
+
+    def unpack(self, folder: str) -> None:
+        """
+        将角色包解包为可修改的角色文件夹：角色配置、图像、音效文件与托盘图标
+        :param folder: 角色文件夹
+        """
+        os.makedirs(folder, exist_ok=True)
+        cfg: dict[str, Any] = dict(self.config)
+        for name in ("image", "image_active"):
+            section = self.sections.get(name)
+            if section is None:
+                cfg.pop(name, None) # 按下动画的图像与待机图像相同
+                continue
+            kind, width, height, _ = self.SPRITE.unpack_from(section)
+            data: memoryview = section[self.SPRITE.size:]
+            file_name: str = os.path.basename(cfg.get(name, name))
+            if kind == b"RAW ": # 二值化后的像素，存为PNG
+                file_name = os.path.splitext(file_name)[0] + ".png"
+                Image.frombuffer("RGBA", (width, height), data, "raw", "RGBA", 0, 1).save(os.path.join(folder, file_name)) # type: ignore
+            else: # 动图的原始文件
+                with open(os.path.join(folder, file_name), "wb") as f:
+                    f.write(data)
+            cfg[name] = file_name
+        for name, data in (("sound", self.sections.get("sound_file")), ("icon", self.icon)):
+            if name not in cfg:
+                continue
+            if data is None:
+                print(f"角色包中没有 {cfg[name]}")
+                continue
+            cfg[name] = os.path.basename(cfg[name])
+            with open(os.path.join(folder, cfg[name]), "wb") as f:
+                f.write(data)
+        dump_char_config(cfg, folder) # type: ignore
+
+    @classmethod
+    def write(
+        cls, path: str, cfg: CharConfig, sprite: Sprite, sprite_active: Sprite | None,
+        frames: FrameSet | None, sound: PackedSound | None, icon: bytes | None
+    ) -> None:
+        """
+        原子地写入角色包
+        :param path: 角色包文件路径
+        :param cfg: 角色配置
+        :param sprite: 待机图像
+        :param sprite_active: 按下动画的图像（与待机图像相同时为 None）
+        :param frames: 已生成图集的动画帧
+        :param sound: 音效
+        :param icon: 托盘图标文件内容
+        """
+        def sprite_chunks(sprite: Sprite) -> list[bytes | memoryview]:
+            if sprite.data is None:
+                return [cls.SPRITE.pack(b"RAW ", *sprite.size, sprite.digest), sprite.source.convert("RGBA").tobytes()]
+            return [cls.SPRITE.pack(b"FILE", *sprite.size, sprite.digest), sprite.data]
+
+        sections: dict[str, list[bytes | memoryview]] = {
+            "config": [json.dumps(dict(cfg), ensure_ascii=False).encode()],
+            "image": sprite_chunks(sprite),
+        }
+        if sprite_active is not None:
+            sections["image_active"] = sprite_chunks(sprite_active)
+        if frames is not None and frames.atlas is not None:
+            atlas = io.BytesIO()
+            frames.atlas.write(atlas)
+            sections["frames"] = [
+                cls.FRAMES.pack(frames.key.encode(), len(frames.press_sizes), len(frames.release_sizes)), atlas.getbuffer()
+            ]
+        if sound is not None:
+            if sound.format is not None:
+                sections["sound"] = [cls.SOUND.pack(*sound.format), sound.pcm]
+            if sound.data:
+                sections["sound_file"] = [sound.data]
+        if icon is not None:
+            sections["icon"] = [icon]
+
+        table: list[tuple[str, int, int]] = []
+        offset: int = cls.HEADER.size + cls.SECTION.size * len(sections)
+        for name, chunks in sections.items():
+            offset = -(-offset // cls.ALIGN) * cls.ALIGN
+            length: int = sum(memoryview(chunk).nbytes for chunk in chunks)
+            table.append((name, offset, length))
+            offset += length
+
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(temp_path, "wb") as f:
+                f.write(cls.HEADER.pack(cls.MAGIC, cls.VERSION, len(sections)))
+                for name, offset, length in table:
+                    f.write(cls.SECTION.pack(name.encode(), offset, length))
+                for (name, offset, _), chunks in zip(table, sections.values()):
+                    f.write(bytes(offset - f.tell()))
+                    for chunk in chunks:
+                        f.write(chunk)
+            os.replace(temp_path, path)
+        except BaseException:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+            raise
+
+
+def load_char_pack(path: str) -> CharPack:
+    """打开角色包（文件未变化时复用已映射的角色包）"""
+    path = resource_path(path)
+    stat = os.stat(path)
+    return open_char_pack(path, stat.st_mtime_ns, stat.st_size)
+
+@functools.lru_cache(maxsize=8)
+def open_char_pack(path: str, mtime_ns: int, size: int) -> CharPack:
+    return CharPack(path)
+
+
+class FrameSet:
+    """
+    一个角色的全部动画帧：按下与释放两段按需生成的帧序列，以及后台生成的图集
+
+    动画帧只取决于缓存键，因此缓存键相同的角色共用同一个 FrameSet（见 PetHost.frame_set）；
+    图像是动图时，每段动画的第 i 帧取图像在第 i / fps 秒的帧再缩放；
+    (图像的帧序号, 尺寸) 相同的帧内容相同，无论属于哪段动画都只生成一次
+    """
+    def __init__(
+        self, key: str, sprite: Sprite, press_sizes: list[tuple[int, int]], release_sizes: list[tuple[int, int]],
+        fps: int, resample: Image.Resampling, capacity: int, pool: ThreadPoolExecutor
+    ) -> None:
+        """
+        :param key: 缓存键
+        :param sprite: 按下动画的图像
+        :param press_sizes: 按下动画各帧尺寸
+        :param release_sizes: 释放动画各帧尺寸
+        :param fps: 帧率
+        :param resample: 缩放算法
+        :param capacity: 内存中动画帧的容量上限（字节），按帧数比例分配给两段动画
+        :param pool: 执行预取的线程池
+        """
+        self.key: str = key
+        self.sprite: Sprite = sprite
+        self.fps: int = fps
+        self.press_sizes: list[tuple[int, int]] = press_sizes
+        self.release_sizes: list[tuple[int, int]] = release_sizes
+        self.resample: Image.Resampling = resample
+        self.atlas: FrameAtlas | None = None # 图集生成之前按需生成各帧
+        self.baked: threading.Event = threading.Event() # 图集是否已生成（或生成失败）
+        self.cancelled: threading.Event = threading.Event() # 放弃生成图集（退出时）
+        self.baker: threading.Thread | None = None # 后台生成图集的线程
+        self.shared: weakref.WeakValueDictionary[tuple[int, tuple[int, int]], Frame] = weakref.WeakValueDictionary() # 按需生成的帧
+        self.shared_lock: threading.Lock = threading.Lock()
+        total: int = max(len(press_sizes) + len(release_sizes), 1)
+        self.press: LazyFrames = LazyFrames(
+            self.renderer(press_sizes, 0), len(press_sizes), capacity * len(press_sizes) // total, pool
+        )
+        self.release: LazyFrames = LazyFrames(
+            self.renderer(release_sizes, len(press_sizes)), len(release_sizes), capacity * len(release_sizes) // total, pool
+        )
+
+    def renderer(self, sizes: list[tuple[int, int]], start: int) -> Callable[[int], Frame]:
+        def render(index: int) -> Frame:
+            atlas = self.atlas
+            if atlas is not None:
+                return atlas.frame(start + index)
+            key: tuple[int, tuple[int, int]] = (self.source_index(index), sizes[index])
+            with self.shared_lock:
+                frame: Frame | None = self.shared.get(key)
+            if frame is None:
+                frame = bake_frame(self.sprite, key[0], key[1], self.resample)
+                with self.shared_lock:
+                    frame = self.shared.setdefault(key, frame)
+            return frame
+        return render
+
+    def source_index(self, index: int) -> int:
+        """动画第 index 帧对应的图像帧序号"""
+        return self.sprite.locate(index / self.fps)[0]
+
+    def frame_id(self, animation: str, index: int) -> tuple[str, int, tuple[int, int]]:
+        """
+        帧的标识：内容相同的帧标识相同，用作显示缓存的键，使重复的帧共用同一个 PhotoImage
+        :param animation: "press" 或 "release"
+        :param index: 帧序号
+        """
+        sizes: list[tuple[int, int]] = self.press_sizes if animation == "press" else self.release_sizes
+        return self.key, self.source_index(index), sizes[index]
+
+    def report(self) -> str:
+        total: int = len(self.press_sizes) + len(self.release_sizes)
+        atlas = self.atlas
+        if atlas is None:
+            return f"动画帧 {total} 帧（{'无图集，按需生成' if self.baked.is_set() else '图集生成中'}）"
+        return f"动画帧 {total} 帧，其中不同的 {atlas.unique_count} 帧，图集 {atlas.nbytes / 2 ** 20:.1f} MiB"
+
+    def bake(self, cache: FrameCache) -> None:
+        """
+        边生成边将图集写入缓存，之后改由内存映射的图集取帧（由系统按需换页）；
+        写入缓存失败时不保留图集，仍按需生成各帧，内存占用受 frame_memory 限制
+        """
+        try:
+            start: float = time.perf_counter()
+            keys: list[tuple[int, tuple[int, int]]] = [
+                (self.source_index(index), size)
+                for sizes in (self.press_sizes, self.release_sizes) for index, size in enumerate(sizes)
+            ]
+
+            def write(f: BinaryIO) -> None:
+                FrameAtlas.write_frames(
+                    f, keys, stream_frames(self.sprite, list(dict.fromkeys(keys)), self.resample, cancel=self.cancelled)
+                )
+
+            atlas = cache.store(self.key, len(self.press_sizes), len(self.release_sizes), write)
+            metrics.record("bake_atlas", time.perf_counter() - start)
+            if atlas is not None:
+                self.atlas = atlas
+        finally:
+            self.baked.set()
+
+    def cancel(self, timeout: float = 1.0) -> None:
+        """
+        放弃生成图集，并等待后台线程删除写了一半的临时文件
+        :param timeout: 最长等待时间（秒）
+        """
+        self.cancelled.set()
+        if self.baker is not None:
+            self.baker.join(timeout)
+
+    def clear(self) -> None:
+        self.press.clear()
+        self.release.clear()
+
+
+class FloatingImage:
+    """
+    一个角色窗口：宿主根窗口的 Toplevel
+
+    各角色只保存自己的配置、图像与动画状态，
+    帧调度器、音效引擎、托盘等资源都由宿主（PetHost）提供
+    """
+    def __init__(self, host: PetHost, char: str) -> None:
+        """
+        :param host: 宿主
+        :param char: 角色文件夹或角色包
+        """
+        self.host: PetHost = host
+        self.char: str = char
+        self.pack: CharPack | None = load_char_pack(char) if is_char_pack(char) else None
+        self.char_config: CharConfig = load_char_config(char)
+        self.window: tk.Toplevel = tk.Toplevel(host.root)
+        self.window.overrideredirect(True) # 无边框
+        self.window.resizable(False, False) # 禁止缩放
+        self.window.attributes('-topmost', config["topmost"]) # 最上层显示
+        self.setup_window()
+
+        self.sound: SoundSource = self.sound_source()
+
+        # 动画相关
+        self.started: bool = False # 动画帧准备好之前不响应输入
+        self.pressing: bool = False # 按键是否按下
+        self.animating: str = "" # 正在播放的动画
+        self.animation_start_time: float = FrameScheduler.now() # 动画起始时间
+        self.current_frame: int = 0 # 动画当前位于第几帧
+        self.input_time: float | None = None # 尚未显示首帧的输入时刻
+
+        # 初始化图片（先只显示待机图片，动画帧稍后准备）
+        try:
+            self.load_image()
+        except Exception:
+            self.window.destroy() # 素材读取失败时不留下空窗口
+            raise
+        self.create_canvas()
 
         # 拖动相关
+        self.mouse_down: bool = False # 左键是否按在不透明像素上
         self.dragging: bool = False
-        self.start_x: int = 0
+        self.start_x: int = 0 # 开始拖动时的指针坐标
         self.start_y: int = 0
+        self.start_window_x: int = 0 # 开始拖动时的窗口坐标
+        self.start_window_y: int = 0
+
+        # 输入合并：在下一帧统一处理积压的输入
+        self.held_keys: set[str] = set() # 按住的键
+        self.released_keys: set[str] = set() # 本帧内松开的键（若随即又按下，则是按键自动重复）
+        self.drag_target: tuple[int, int] | None = None # 本帧内拖动的目标窗口坐标
+        self.input_pending: bool = False
 
         # 绑定事件
         self.canvas.bind("<Button-1>", self.on_mouse_press)
         self.canvas.bind("<B1-Motion>", self.on_drag)
         self.canvas.bind("<ButtonRelease-1>", self.on_mouse_release)
         self.canvas.bind("<Button-3>", self.show_right_menu)
-        self.root.bind("<Key>", self.on_key_press)
-        self.root.bind("<KeyRelease>", self.on_key_release)
-        
-        self.create_right_menu() # 创建右键菜单
-        self.create_tray() # 创建系统托盘
-        self.root.geometry(f"{self.width}x{self.height}+0+0") # 调整窗口大小
-        x: int = config.get("x", root.winfo_screenwidth() // 2)
-        y: int = config.get("y", root.winfo_screenheight() // 2)
-        self.set_pos(x, y) # 调整窗口位置
-
+        self.window.bind("<Key>", self.on_key_press)
+        self.window.bind("<KeyRelease>", self.on_key_release)
+        self.window.bind("<FocusOut>", self.on_focus_out)
+
+        self.window.geometry(f"{self.width}x{self.height}+0+0") # 调整窗口大小
+        self.sources: dict[str, tuple[int, int] | None] = self.stat_sources()
+
+    @property
+    def name(self) -> str:
+        return self.char_config.get("name", os.path.basename(self.char))
+
+    @property
+    def frame_atlas(self) -> FrameAtlas | None:
+        return self.frames.atlas if hasattr(self, "frames") else None
+
+    def res_path(self, relative_path: str) -> str:
+        """计算本角色的素材路径"""
+        return char_res_path(relative_path, self.char)
+
+    def sound_source(self) -> SoundSource:
+        """音效：角色包中预解码的音效，或角色文件夹中的音效文件路径"""
+        if self.pack is not None and self.pack.sound is not None:
+            return self.pack.sound
+        return self.res_path(self.char_config["sound"])
+
+    def open_sprite(self, active: bool) -> Sprite:
+        """
+        读取图像（每次调用都得到独立的解码器）
+        :param active: 读取按下动画的图像（否则为待机图像）
+        """
+        capacity: int = config["decode_memory"] << 20
+        if self.pack is not None:
+            sprite = self.pack.sprite("image_active", capacity) if active else None
+            sprite = sprite or self.pack.sprite("image", capacity)
+            if sprite is None:
+                raise ValueError("角色包中没有图像")
+            return sprite
+        path: str = self.char_config.get("image_active", self.char_config["image"]) if active else self.char_config["image"]
+        return Sprite.open(self.res_path(path), capacity)
+
+    def init_frames(self) -> None:
+        """准备动画帧，随后开始响应输入"""
+        self.gen_frames()
+        self.started = True
+        self.animate_idle()
         # 欢迎
-        threading.Thread(target=self.play_sound).start()
+        self.play_sound()
         self.continue_animation(auto=True)
-    
+
+    def setup_window(self) -> None:
+        """按角色配置设置窗口标题、图标与透明色"""
+        self.window.title(self.name)
+        icon_path = self.char_config.get("icon")
+        try:
+            if self.pack is not None:
+                pass # 角色包中的图标只用于托盘
+            elif icon_path is not None:
+                self.window.iconbitmap(self.res_path(icon_path))
+            else:
+                self.window.iconphoto(True, tk.PhotoImage(self.char_config["image"]))
+        except tk.TclError: pass
+        if os.name == 'nt':  # Windows系统
+            self.window.attributes('-transparentcolor', self.char_config["miyu_color"]) # 透明色（根据图片调整）
+
     def get_pos(self) -> tuple[int, int]:
         """获取窗口位置"""
         return (
-            self.root.winfo_x() + (self.width // 2),
-            self.root.winfo_y() + self.height
+            self.window.winfo_x() + (self.width // 2),
+            self.window.winfo_y() + self.height
         )
-    
+
     def set_pos(self, x: int, y: int) -> None:
         """设置窗口位置"""
-        self.root.geometry(f"{self.width}x{self.height}+{x - (self.width // 2)}+{y - self.height}")
-        
+        self.window.geometry(f"{self.width}x{self.height}+{x - (self.width // 2)}+{y - self.height}")
+
     def back_to_screen(self) -> None:
         """使窗口回到屏幕范围内"""
         x, y = self.get_pos()
         x = max(x, self.width // 2)
         y = max(y, self.height)
-        x = min(x, self.root.winfo_screenwidth() - self.width // 2)
-        y = min(y, self.root.winfo_screenheight())
+        x = min(x, self.window.winfo_screenwidth() - self.width // 2)
+        y = min(y, self.window.winfo_screenheight())
         self.set_pos(x, y)
 
-    def display_image(self, image: Image.Image) -> None:
-        """显示图片"""
-        self.tk_image = ImageTk.PhotoImage(image)
-        self.canvas.itemconfig(self.canvas_image, image=self.tk_image)
-        
-        # 底部对齐
-        new_x: int = (self.width - self.tk_image.width()) // 2
-        new_y: int = self.height - self.tk_image.height()
-        self.canvas.coords(self.canvas_image, new_x, new_y)
-        
+    def display_image(self, frame: Frame, key: Hashable) -> None:
+        """
+        显示图片
+        :param frame: 动画帧
+        :param key: 动画帧的唯一标识，用于复用已转换的 PhotoImage（各角色共用同一个图像缓存）
+        """
+        start: float = time.perf_counter()
+        try:
+            photo: ImageTk.PhotoImage = self.host.photos.get(key, frame.image)
+            if photo is self.tk_image:
+                return
+            self.tk_image = photo
+            self.shown_frame = frame
+            self.canvas.itemconfig(self.canvas_image, image=self.tk_image)
+
+            # 完整帧底部对齐，再加上裁剪区域的偏移（位置未变时无需移动）
+            pos: tuple[int, int] = self.frame_pos(frame)
+            if pos == self.tk_image_pos:
+                return
+            self.tk_image_pos = pos
+            self.canvas.coords(self.canvas_image, *pos)
+        finally:
+            metrics.record("display_image", time.perf_counter() - start)
+
+    def frame_pos(self, frame: Frame) -> tuple[int, int]:
+        """计算动画帧在画布上的位置"""
+        return (
+            (self.width - frame.size[0]) // 2 + frame.offset[0],
+            self.height - frame.size[1] + frame.offset[1]
+        )
+
     def load_image(self) -> None:
         """加载图片并保持原始像素"""
         missing_image: Image.Image = Image.new("RGBA", (0x100, 0x100), "#F800F8")
@@ -220,219 +2028,409 @@ class FloatingImage:
         draw.rectangle(((0x0, 0x0), (0x80, 0x80)), fill="#000000")
         draw.rectangle(((0x80, 0x80), (0x100, 0x100)), fill="#000000")
         draw.text((0x20, 0x10), ":(", fill="#F800F8", font_size=0x40)
-        
-        self.image: Image.Image
+
+        # 动图只解码第一帧，其余帧在播放时才解码
+        self.sprite: Sprite
         try:
-            self.image = threshold(Image.open(char_res_path(char_config["image"])).convert("RGBA"))
+            self.sprite = self.open_sprite(False)
         except Exception:
-            self.image = missing_image.copy()
-        
-        self.image_active: Image.Image
-        image_active_path = char_config.get("image_active", None)
-        if image_active_path is not None:
+            self.sprite = Sprite.from_image(missing_image)
+
+        # 待机动图与按下动画即使是同一张动图也各自解码，以免互相打乱解码进度
+        self.sprite_active: Sprite
+        image_active_path = self.char_config.get("image_active", None)
+        if image_active_path is None and self.sprite.count == 1:
+            self.sprite_active = self.sprite
+        else:
             try:
-                self.image_active = threshold(Image.open(char_res_path(image_active_path)).convert("RGBA"))
+                self.sprite_active = self.open_sprite(True)
             except Exception as e:
                 print(e)
-                self.image_active = missing_image.copy()
-        else:
-            self.image_active = self.image.copy()
+                self.sprite_active = Sprite.from_image(missing_image)
+
+        self.image_active: Image.Image = self.sprite_active.frame(0)
+        self.scale_images()
+
+    def scale_images(self) -> None:
+        """按显示缩放比例生成待机图片（动图的各帧按需生成），并计算画布大小"""
+        sprite: Sprite = self.sprite
+        size: tuple[int, int] = scale_size(sprite.size, char_scale(self.char_config))
+        resample = Image.Resampling.BILINEAR if self.char_config.get("smooth", True) else Image.Resampling.NEAREST
+        self.image: Image.Image = sprite.scaled(0, size, resample) # 缩放后的待机图片
+
+        self.idle_frame: Frame = crop_frame(self.image)
+        self.idle_key: Hashable = ("idle", next(self.host.idle_keys)) # 每次加载都使用新的标识，旧图像随LRU淘汰
+        # 待机动图的各帧（裁剪后），按需生成并预取
+        if hasattr(self, "idle_frames"):
+            self.idle_frames.clear()
+        self.idle_frames: LazyFrames = LazyFrames(
+            lambda index: bake_frame(sprite, index, size, resample), sprite.count, config["decode_memory"] << 20, self.host.frame_pool
+        )
+        self.idle_frames.put(0, self.idle_frame)
+        self.idle_start: float = FrameScheduler.now() # 待机动图的起始时间
+        self.idle_index: int = 0 # 待机动图当前显示的帧
 
-        # 动画相关
-        self.pressing: bool = False # 按键是否按下
-        self.animating: str = "" # 正在播放的动画
-        self.animation_start_time: float = time.time() # 动画起始时间
-        self.current_frame: int = 0 # 动画当前位于第几帧
-        self.gen_frames()
-        
         # 略微扩展画布大小，以避免图像在动画过程中溢出画布范围
-        self.width: int = int(self.image.size[0] / (1 - abs(char_config["factor"])))
-        self.height: int = int(self.image.size[1] / (1 - abs(char_config["factor"])))
-        
-        # 禁用高DPI缩放，保持原始像素
-        self.root.tk.call('tk', 'scaling', 1.0)
+        self.width: int = int(self.image.size[0] / (1 - abs(self.char_config["factor"])))
+        self.height: int = int(self.image.size[1] / (1 - abs(self.char_config["factor"])))
 
-        # 重新创建画布
+    def create_canvas(self) -> None:
+        """创建画布并显示待机图片"""
         self.canvas: tk.Canvas = tk.Canvas(
-            self.root, width=self.width, height=self.height,
-            highlightthickness=0, bg=char_config["miyu_color"]
+            self.window, width=self.width, height=self.height,
+            highlightthickness=0, bg=self.char_config["miyu_color"]
         )
         self.canvas.pack()
 
         # 转换为tkinter可用格式
-        self.tk_image: ImageTk.PhotoImage = ImageTk.PhotoImage(self.image)
+        self.tk_image: ImageTk.PhotoImage = self.host.photos.get((self.idle_key, 0), self.idle_frame.image)
+        self.tk_image_pos: tuple[int, int] = self.frame_pos(self.idle_frame)
+        self.shown_frame: Frame = self.idle_frame # 当前显示的动画帧，用于点击检测
+        self.canvas_image: int = self.canvas.create_image(*self.tk_image_pos, anchor=tk.NW, image=self.tk_image)
 
-        # 底部对齐
-        x: int = (self.width - self.tk_image.width()) // 2
-        y: int = self.height - self.tk_image.height()
-
-        self.canvas_image: int = self.canvas.create_image(x, y, anchor=tk.NW, image=self.tk_image)
-            
     def start_animation(self, *, auto: bool = False) -> None:
         """播放按下动画"""
         if not auto:
-            if self.pressing: return
-            if time.time() - self.animation_start_time < config["cooldown"]: return
+            if self.pressing or not self.started: return
+            if FrameScheduler.now() - self.animation_start_time < config["cooldown"]: return
             self.pressing = True
-        
-        self.animation_start_time: float = time.time()
+            self.input_time = FrameScheduler.now()
+
+        self.animation_start_time: float = FrameScheduler.now()
         self.current_frame = 0
         self.animating = "press " + str(random.random())
-        
-        threading.Thread(target=self.play_sound).start()
-        
-        self.animate_press(self.animating)
-            
+
+        self.play_sound(self.input_time if not auto else None)
+
+        animation_id: str = self.animating
+        self.host.scheduler.add(self, lambda frame_time: self.animate_press(animation_id, frame_time))
+
     def continue_animation(self, *, auto: bool = False) -> None:
         """播放释放动画"""
         if not auto:
-            if not self.pressing: return
+            if not self.pressing or not self.started: return
             self.pressing = False
-        
-        self.animation_start_time: float = time.time()
+
+        self.animation_start_time: float = FrameScheduler.now()
         self.current_frame = 0
         self.animating = "release " + str(random.random())
-        
-        self.animate_release(self.animating)
+
+        animation_id: str = self.animating
+        self.host.scheduler.add(self, lambda frame_time: self.animate_release(animation_id, frame_time))
 
     def on_key_press(self, event: tk.Event) -> None:
-        """键盘按键事件"""
-        self.start_animation()
+        """
+        键盘按键事件
+        
+        按键自动重复产生的事件（Windows 上是重复的按下，X11 上是成对的松开与按下）不会重新触发动画，
+        同时按住多个键时，按下第一个键才开始、松开最后一个键才结束
+        """
+        metrics.count("input_events")
+        key: str = event.keysym
+        if key in self.released_keys: # 刚松开又按下：按键自动重复
+            self.released_keys.discard(key)
+            return
+        if key in self.held_keys:
+            return
+        self.held_keys.add(key)
+        if len(self.held_keys) == 1:
+            self.start_animation()
 
     def on_key_release(self, event: tk.Event) -> None:
-        """键盘按键事件"""
-        self.continue_animation()
+        """键盘按键事件（推迟到下一帧处理，以识别按键自动重复）"""
+        metrics.count("input_events")
+        if event.keysym in self.held_keys:
+            self.released_keys.add(event.keysym)
+            self.request_input()
+
+    def on_focus_out(self, event: tk.Event) -> None:
+        """失去焦点后收不到松开按键的事件，视为松开所有键"""
+        if self.held_keys:
+            self.released_keys |= self.held_keys
+            self.request_input()
+
+    def hit_test(self, x: int, y: int) -> bool:
+        """判断画布上的坐标是否落在当前显示的动画帧的不透明像素上"""
+        return self.shown_frame.hit(x - self.tk_image_pos[0], y - self.tk_image_pos[1])
 
     def on_mouse_press(self, event: tk.Event) -> None:
-        """左键点击事件"""
+        """左键点击事件（点在透明区域时忽略）"""
+        self.mouse_down = self.hit_test(event.x, event.y)
+        if not self.mouse_down:
+            return
         if self.animating.startswith("release"):
             # 记录拖动起始位置
             self.dragging = True
-            self.start_x = event.x
-            self.start_y = event.y
+            self.start_x = event.x_root
+            self.start_y = event.y_root
+            self.start_window_x = self.window.winfo_x()
+            self.start_window_y = self.window.winfo_y()
         self.start_animation()
 
     def on_drag(self, event: tk.Event) -> None:
-        """左键拖动事件"""
+        """左键拖动事件（只记录目标位置，每帧至多移动一次窗口）"""
+        metrics.count("input_events")
         if self.dragging:
-            # 计算新位置
-            x: int = self.root.winfo_x() + (event.x - self.start_x)
-            y: int = self.root.winfo_y() + (event.y - self.start_y)
-            self.root.geometry(f"+{x}+{y}")
+            self.drag_target = (
+                self.start_window_x + (event.x_root - self.start_x),
+                self.start_window_y + (event.y_root - self.start_y)
+            )
+            self.request_input()
 
-    def on_mouse_release(self, event: tk.Event) -> None: 
+    def on_mouse_release(self, event: tk.Event) -> None:
         """左键释放事件"""
+        if not self.mouse_down:
+            return
+        self.mouse_down = False
+        self.apply_input() # 先移动到最后的拖动位置
         self.dragging = False
         self.continue_animation()
-        x, y = self.get_pos()
-        config["x"] = x
-        config["y"] = y
-        dump_config()
+        self.host.save_pets()
+
+    def request_input(self) -> None:
+        """安排在下一帧处理积压的输入"""
+        if not self.input_pending:
+            self.input_pending = True
+            self.host.scheduler.add((self, "input"), lambda frame_time: self.apply_input(), immediate=False)
+
+    def apply_input(self) -> bool:
+        """处理积压的输入：松开的键与最新的拖动位置"""
+        self.input_pending = False
+        metrics.count("input_applied")
+        if self.released_keys:
+            self.held_keys -= self.released_keys
+            self.released_keys.clear()
+            if not self.held_keys:
+                self.continue_animation()
+        if self.drag_target is not None:
+            x, y = self.drag_target
+            self.drag_target = None
+            self.window.geometry(f"+{x}+{y}")
+        return False
+
+    def play_sound(self, since: float | None = None) -> None:
+        """
+        播放音效
+        :param since: 触发播放的输入时刻（用于统计延迟），默认为当前时刻
+        """
+        if self.host.audio is not None:
+            self.host.audio.play(self.sound, config["echo"], since)
+
+    def frames_cache_key(self) -> str:
+        """当前配置下动画帧的缓存键"""
+        return FrameCache.key(self.sprite_active, config["fps"], self.char_config, char_scale(self.char_config))
 
-    def play_sound(self) -> None:
-        """播放音效"""
-        try:
-            if not config["echo"]:
-                self.sound.stop()
-            self.sound.play()
-        except:
-            pass
-    
     def gen_frames(self) -> None:
-        """提前生成所有动画帧"""
-        self.press_animation: list[Image.Image] = []
-        for frame in range(int(char_config["duration_active"] * config["fps"])):
-            x_factor, y_factor = press_easing_curve(frame / (char_config["duration_active"] * config["fps"]))
-            img: Image.Image = self.image_active.resize((
-                int(self.image_active.size[0] * x_factor),
-                int(self.image_active.size[1] * y_factor)
-            ), Image.Resampling.BILINEAR if char_config.get("smooth", True) else Image.Resampling.NEAREST)
-            self.press_animation.append(threshold(img))
-            
-        self.release_animation: list[Image.Image] = []
-        for frame in range(int(char_config["duration"] * config["fps"])):
-            x_factor, y_factor = release_easing_curve(frame / (char_config["duration"] * config["fps"]))
-            img: Image.Image = self.image_active.resize((
-                int(self.image_active.size[0] * x_factor),
-                int(self.image_active.size[1] * y_factor)
-            ), Image.Resampling.BILINEAR if char_config.get("smooth", True) else Image.Resampling.NEAREST)
-            self.release_animation.append(threshold(img))
-    
-    def animate_press(self, animation_id: str) -> None:
-        """按下动画（纵轴缩放）"""
+        """准备动画帧（与缓存键相同的其他角色共用）"""
+        start: float = time.perf_counter()
+        self.frames: FrameSet = self.host.frame_set(self.sprite_active, self.char_config, self.pack)
+        self.frames_key: str = self.frames.key
+        self.press_animation: LazyFrames = self.frames.press
+        self.release_animation: LazyFrames = self.frames.release
+        metrics.record("gen_frames", time.perf_counter() - start)
+
+    def animate_press(self, animation_id: str, frame_time: float) -> bool:
+        """
+        按下动画（纵轴缩放）
+        :param animation_id: 动画标识
+        :param frame_time: 名义帧时间
+        :return: 是否继续播放
+        """
         if self.animating != animation_id:
-            return
+            return False
+        metrics.record("lateness", max(FrameScheduler.now() - frame_time, 0.0))
 
         # 计算当前应当播放第几帧，并判断是否播放完毕
-        self.current_frame = int((time.time() - self.animation_start_time) * config["fps"])
-        if self.current_frame >= char_config["duration_active"] * config["fps"]:
+        self.current_frame = max(int((frame_time - self.animation_start_time) * config["fps"]), 0)
+        if self.current_frame >= self.char_config["duration_active"] * config["fps"]:
             self.animating = ""
-            self.display_image(self.press_animation[-1])
+            self.display_image(self.press_animation[-1], self.frames.frame_id("press", len(self.press_animation) - 1))
             if not self.pressing:
                 self.continue_animation(auto=True)
-            return
-        
-        # 设置当前所显示的帧
-        self.display_image(self.press_animation[self.current_frame])
-
-        # 准备播放下一帧动画
-        self.root.after(500 // config["fps"], lambda: self.animate_press(animation_id))
+            return False
 
-    def animate_release(self, animation_id: str) -> None:
-        """释放动画（纵轴缩放）"""
+        # 设置当前所显示的帧
+        self.display_image(self.press_animation[self.current_frame], self.frames.frame_id("press", self.current_frame))
+        if self.input_time is not None:
+            metrics.record("input_to_frame", FrameScheduler.now() - self.input_time)
+            self.input_time = None
+        return True
+
+    def animate_release(self, animation_id: str, frame_time: float) -> bool:
+        """
+        释放动画（纵轴缩放）
+        :param animation_id: 动画标识
+        :param frame_time: 名义帧时间
+        :return: 是否继续播放
+        """
         if self.animating != animation_id:
-            return
+            return False
+        metrics.record("lateness", max(FrameScheduler.now() - frame_time, 0.0))
 
         # 计算当前应当播放第几帧，并判断是否播放完毕
-        self.current_frame = int((time.time() - self.animation_start_time) * config["fps"])
-        if self.current_frame >= char_config["duration"] * config["fps"]:
+        self.current_frame = max(int((frame_time - self.animation_start_time) * config["fps"]), 0)
+        if self.current_frame >= self.char_config["duration"] * config["fps"]:
             self.animating = ""
-            self.display_image(self.image)
-            return
-        
+            self.show_idle()
+            return False
+
         # 设置当前所显示的帧
-        self.display_image(self.release_animation[self.current_frame])
+        self.display_image(self.release_animation[self.current_frame], self.frames.frame_id("release", self.current_frame))
+        return True
+
+    def show_idle(self, now: float | None = None) -> None:
+        """
+        显示待机图片（动图则显示当前时刻的一帧）
+        :param now: 时刻，默认为当前时刻
+        """
+        self.idle_index, _ = self.sprite.locate((FrameScheduler.now() if now is None else now) - self.idle_start)
+        self.display_image(self.idle_frames[self.idle_index], (self.idle_key, self.idle_index))
+
+    def animate_idle(self) -> None:
+        """循环播放待机动图：作为帧调度器的任务，只在动图切换到下一帧时执行"""
+        if self.sprite.count == 1:
+            self.host.scheduler.remove((self, "idle"))
+            return
+        self.host.scheduler.add((self, "idle"), self.animate_idle_frame)
+
+    def animate_idle_frame(self, frame_time: float) -> float:
+        """
+        待机动图的一帧：动图切换到下一帧时才更新显示，播放按下与释放动画时不显示
+        :param frame_time: 名义帧时间
+        :return: 动图切换到下一帧的时刻
+        """
+        index, remaining = self.sprite.locate(frame_time - self.idle_start)
+        if not self.animating and index != self.idle_index:
+            self.show_idle(frame_time)
+        return frame_time + remaining
+
+    def stat_sources(self) -> dict[str, tuple[int, int] | None]:
+        """获取角色文件夹中各素材文件（或角色包）的修改时间与大小"""
+        if is_char_pack(self.char):
+            try:
+                stat = os.stat(resource_path(self.char))
+                return {self.char: (stat.st_mtime_ns, stat.st_size)}
+            except OSError:
+                return {self.char: None}
+        paths: list[str] = [path_char_config, self.char_config["image"], self.char_config["sound"]]
+        for optional in ("image_active", "icon"):
+            if optional in self.char_config:
+                paths.append(self.char_config[optional]) # type: ignore
+        sources: dict[str, tuple[int, int] | None] = {}
+        for path in paths:
+            try:
+                stat = os.stat(self.res_path(path))
+                sources[path] = (stat.st_mtime_ns, stat.st_size)
+            except OSError:
+                sources[path] = None
+        return sources
+
+    def reload_char(self, char: str | None = None) -> bool:
+        """
+        在当前窗口中热重载角色，只重新生成发生变化的部分
+        :param char: 改用的角色文件夹或角色包，默认重新读取当前角色
+        :return: 是否成功（读取失败时保持原来的角色）
+        """
+        old_sources: dict[str, tuple[int, int] | None] = self.sources
+        new_char: str = self.char if char is None else char
+        try:
+            pack: CharPack | None = load_char_pack(new_char) if is_char_pack(new_char) else None
+            char_config: CharConfig = load_char_config(new_char)
+        except Exception as e:
+            print(e)
+            if char is None:
+                self.sources = self.stat_sources() # 即使读取失败也记录，避免监视时反复重试
+            return False
+        self.char, self.pack, self.char_config = new_char, pack, char_config
+        self.sources = self.stat_sources()
+        changed: set[str] = {path for path in self.sources if self.sources[path] != old_sources.get(path)}
+
+        self.setup_window()
+        self.update_right_menu()
+        self.host.update_tray()
+
+        # 音效
+        old_sound: SoundSource = self.sound
+        self.sound = self.sound_source()
+        if self.host.audio is not None and (self.sound != old_sound or self.char_config["sound"] in changed):
+            self.host.audio.load(self.sound)
+
+        # 图片：仅当动画帧的输入发生变化时才重新生成动画帧
+        x, y = self.get_pos()
+        self.animating = ""
+        self.host.scheduler.remove(self)
+        self.load_image()
+        self.show_images(x, y)
+        return True
+
+    def rescale(self) -> None:
+        """按新的显示缩放比例重新生成待机图片与动画帧（不重新读取素材，已生成的mipmap也可复用）"""
+        x, y = self.get_pos()
+        self.animating = ""
+        self.host.scheduler.remove(self)
+        self.scale_images()
+        self.show_images(x, y)
+
+    def show_images(self, x: int, y: int) -> None:
+        """图片或显示缩放比例变化后：按需重新生成动画帧，调整画布并显示待机图片"""
+        if self.started and self.frames_cache_key() != self.frames_key:
+            self.gen_frames()
+        self.canvas.config(width=self.width, height=self.height, bg=self.char_config["miyu_color"])
+        self.tk_image = self.host.photos.get((self.idle_key, 0), self.idle_frame.image)
+        self.tk_image_pos = self.frame_pos(self.idle_frame)
+        self.shown_frame = self.idle_frame
+        self.canvas.itemconfig(self.canvas_image, image=self.tk_image)
+        self.canvas.coords(self.canvas_image, *self.tk_image_pos)
+        self.set_pos(x, y)
+        if self.started:
+            self.animate_idle()
+            self.continue_animation(auto=True)
 
-        # 准备播放下一帧动画
-        self.root.after(500 // config["fps"], lambda: self.animate_release(animation_id))
-    
     def summon(self) -> None:
         """将晴召唤至窗口顶层"""
-        self.root.focus_force()
-        threading.Thread(target=self.play_sound).start()
+        self.window.deiconify()
+        self.window.lift()
+        self.window.focus_force()
+        self.play_sound()
         self.continue_animation(auto=True)
 
     def change_image(self) -> None:
         """更换图片"""
+        if self.pack is not None:
+            print("角色包不能直接修改，请先克隆至文件夹")
+            return
         file_path: str = filedialog.askopenfilename(
             title="选择晴…",
-            initialdir=char_res_path(""),
-            filetypes=[("支持的图片文件", "*.png *.gif *.jpg *.jpeg *.bmp *.webp"), ("所有文件", "*")]
+            initialdir=self.res_path(""),
+            filetypes=[("支持的图片文件", "*.png *.apng *.gif *.jpg *.jpeg *.bmp *.webp"), ("所有文件", "*")]
         )
         if file_path:
             try:
-                shutil.copy(file_path, char_res_path(os.path.basename(file_path)))
+                shutil.copy(file_path, self.res_path(os.path.basename(file_path)))
             except shutil.SameFileError:
                 pass
-            char_config["image"] = os.path.basename(file_path)
-            dump_char_config()
-            self.restart_app()
+            self.char_config["image"] = os.path.basename(file_path)
+            dump_char_config(self.char_config, self.char)
+            self.host.reload_char(self.char)
 
     def change_sound(self) -> None:
         """更换音效"""
+        if self.pack is not None:
+            print("角色包不能直接修改，请先克隆至文件夹")
+            return
         file_path: str = filedialog.askopenfilename(
             title="选择中旋…",
-            initialdir=char_res_path(""),
+            initialdir=self.res_path(""),
             filetypes=[("音频文件", "*.wav *.mp3 *.ogg *.flac"), ("所有文件", "*")]
         )
         if file_path:
             try:
-                shutil.copy(file_path, char_res_path(os.path.basename(file_path)))
+                shutil.copy(file_path, self.res_path(os.path.basename(file_path)))
             except shutil.SameFileError:
                 pass
-            char_config["sound"] = os.path.basename(file_path)
-            dump_char_config()
-            self.restart_app()
+            self.char_config["sound"] = os.path.basename(file_path)
+            dump_char_config(self.char_config, self.char)
+            self.host.reload_char(self.char)
 
     def load_char(self) -> None:
         """从文件夹导入当前角色配置"""
@@ -440,40 +2438,126 @@ class FloatingImage:
             title="导入角色…",
             initialdir=resource_path(""),
         )
-        if file_path:
-            config["char"] = resource_path(file_path)
-            dump_config()
-            self.restart_app()
+        if file_path and self.reload_char(resource_path(file_path)):
+            self.host.save_pets()
 
     def dump_char(self) -> None:
-        """导出当前角色配置至文件夹"""
+        """导出当前角色配置至文件夹（角色包则解包，以便修改图片与音效）"""
         file_path: str = filedialog.askdirectory(
             title="导出角色…",
             initialdir=resource_path(""),
         )
         if file_path:
-            shutil.copytree(resource_path(config["char"]), resource_path(file_path), dirs_exist_ok=True)
-            # self.restart_app()
+            try:
+                if self.pack is not None:
+                    self.pack.unpack(resource_path(file_path))
+                else:
+                    shutil.copytree(resource_path(self.char), resource_path(file_path), dirs_exist_ok=True)
+            except Exception as e:
+                print(e)
 
-    def switch_topmost(self) -> None:
-        """切换窗口置顶状态"""
-        config["topmost"] = not config["topmost"]
-        dump_config()
-        self.root.attributes('-topmost', config["topmost"])
+    def import_pack(self) -> None:
+        """从角色包导入当前角色"""
+        file_path: str = filedialog.askopenfilename(
+            title="导入角色包…",
+            initialdir=resource_path(""),
+            filetypes=[("角色包", "*" + CharPack.SUFFIX), ("所有文件", "*")]
+        )
+        if file_path and self.reload_char(resource_path(file_path)):
+            self.host.save_pets()
+
+    def export_pack(self) -> None:
+        """导出当前角色为角色包（包含预生成的动画帧与预解码的音效），在后台线程中等待图集与音效并写入"""
+        file_path: str = filedialog.asksaveasfilename(
+            title="导出角色包…",
+            initialdir=resource_path(""),
+            initialfile=self.name + CharPack.SUFFIX,
+            defaultextension=CharPack.SUFFIX,
+            filetypes=[("角色包", "*" + CharPack.SUFFIX)]
+        )
+        if not file_path:
+            return
+        # 在Tk线程中取得当前角色的快照，导出过程中重新加载角色也不影响导出的内容
+        path: str = resource_path(file_path)
+        char_config: CharConfig = self.char_config.copy()
+        sprite: Sprite = self.sprite
+        sprite_active: Sprite | None = self.sprite_active if "image_active" in char_config else None
+        frames: FrameSet | None = getattr(self, "frames", None)
+        sound: SoundSource = self.sound
+        pack: CharPack | None = self.pack
+        icon_path: str | None = self.res_path(char_config["icon"]) if pack is None and "icon" in char_config else None # type: ignore
+
+        def export() -> None:
+            try:
+                if frames is not None:
+                    frames.baked.wait() # 等待后台生成图集
+                icon: bytes | None = None
+                if pack is not None:
+                    icon = None if pack.icon is None else bytes(pack.icon)
+                elif icon_path is not None:
+                    with open(icon_path, "rb") as f:
+                        icon = f.read()
+                CharPack.write(path, char_config, sprite, sprite_active, frames, self.packed_sound(sound), icon)
+            except Exception as e:
+                print(e)
+
+        threading.Thread(target=export, daemon=True).start()
+
+    def packed_sound(self, sound: SoundSource) -> PackedSound | None:
+        """
+        将音效文件连同其预解码的PCM打包（混音器不可用时只打包音效文件）
+        :param sound: 音效来源
+        """
+        if isinstance(sound, PackedSound):
+            return sound
+        try:
+            with open(sound, "rb") as f:
+                data: bytes = f.read()
+        except OSError as e:
+            print(e)
+            return None
+        if self.host.audio is None:
+            return PackedSound(b"", None, data)
+        try:
+            mixer_format, pcm = self.host.audio.decode(sound).result(timeout=10)
+        except Exception as e:
+            print(e)
+            return PackedSound(b"", None, data)
+        return PackedSound(pcm, mixer_format, data)
 
     def create_right_menu(self) -> None:
         """创建右键菜单"""
-        self.right_menu: tk.Menu = Menu(self.root, tearoff=0)
+        self.right_menu: tk.Menu = Menu(self.window, tearoff=0)
         self.right_menu.add_command(label="更换中旋…", command=self.change_sound)
         self.right_menu.add_command(label="更换晴…", command=self.change_image)
         self.right_menu.add_separator()
         self.right_menu.add_command(label="读取角色配置…", command=self.load_char)
         self.right_menu.add_command(label="克隆角色配置…", command=self.dump_char)
+        self.right_menu.add_command(label="导入角色包…", command=self.import_pack)
+        self.right_menu.add_command(label="导出角色包…", command=self.export_pack)
+        self.right_menu.add_command(label="添加角色…", command=self.host.ask_pet)
+        self.right_menu.add_command(label="关闭此角色", command=self.close)
         self.right_menu.add_separator()
-        self.right_menu.add_command(label="切换置顶", command=self.switch_topmost)
+        scale_menu: tk.Menu = Menu(self.right_menu, tearoff=0)
+        for scale in PetHost.SCALES:
+            scale_menu.add_radiobutton(
+                label=f"{scale:.0%}", variable=self.host.scale_var, value=scale, command=lambda scale=scale: self.host.set_scale(scale)
+            )
+        self.right_menu.add_cascade(label="缩放", menu=scale_menu)
+        self.right_menu.add_command(label="切换置顶", command=self.host.switch_topmost)
         self.right_menu.add_separator()
-        self.right_menu.add_command(label="重新加载", command=self.restart_app)
-        self.right_menu.add_command(label="退出", command=self.shut_app)
+        self.right_menu.add_command(label="重新加载", command=self.host.reload_app)
+        self.right_menu.add_command(label="退出", command=self.host.shut_app)
+        self.update_right_menu()
+
+    def update_right_menu(self) -> None:
+        """角色包不能直接修改：禁用更换音效与图片（克隆至文件夹后才能修改）"""
+        right_menu: tk.Menu | None = getattr(self, "right_menu", None)
+        if right_menu is None:
+            return
+        state: str = tk.DISABLED if self.pack is not None else tk.NORMAL
+        for label in ("更换中旋…", "更换晴…"):
+            right_menu.entryconfig(label, state=state)
 
     def show_right_menu(self, event: tk.Event) -> None:
         """显示右键菜单"""
@@ -482,78 +2566,607 @@ class FloatingImage:
         except:
             pass
 
-    def create_tray(self) -> None:
-        """创建系统托盘"""
-        # 创建托盘图标
-        tray_icon: Image.Image
+    def load_tray_icon(self) -> Image.Image:
+        """加载托盘图标"""
         try:
-            tray_icon_path = char_config.get("icon", char_config["image"])
-            tray_icon = Image.open(char_res_path(tray_icon_path))
+            if self.pack is not None:
+                if self.pack.icon is None:
+                    return self.image.copy()
+                return Image.open(io.BytesIO(self.pack.icon))
+            tray_icon_path = self.char_config.get("icon", self.char_config["image"])
+            return Image.open(self.res_path(tray_icon_path))
         except:
-            tray_icon = self.image.copy()
-
-        # 托盘菜单
-        tray_menu: tuple[MenuItem, ...] = (
-            MenuItem('召唤', self.summon, default=True),
-            MenuItem('更换中旋…', self.change_sound),
-            MenuItem('更换晴…', self.change_image),
-            MenuItem('读取角色配置…', self.load_char),
-            MenuItem('克隆角色配置…', self.dump_char),
-            MenuItem('切换置顶', self.switch_topmost),
-            MenuItem('找回走失的晴', self.back_to_screen),
-            MenuItem('重新加载', self.restart_app),
-            MenuItem('退出', self.shut_app)
+            return self.image.copy()
+
+    def close(self) -> None:
+        """关闭此角色（最后一个角色关闭时退出程序）"""
+        self.host.remove_pet(self)
+
+    def destroy(self) -> None:
+        self.animating = ""
+        self.host.scheduler.remove((self, "input"))
+        self.host.scheduler.remove((self, "idle"))
+        self.idle_frames.clear()
+        self.host.scheduler.remove(self)
+        self.window.destroy()
+
+
+class PetHost:
+    """
+    宿主：在同一个进程中显示多个角色
+
+    各角色窗口都是同一个隐藏的Tk根窗口的 Toplevel，共用帧调度器、音效引擎、托盘、
+    生成动画帧的线程池与Tk图像缓存；缓存键相同的角色还共用同一份动画帧，
+    因此每多一个角色，只多占用它自己的窗口与待机图片
+    """
+    WATCH_INTERVAL: int = 200 # 监视角色文件夹的间隔（毫秒）
+    SCALES: tuple[float, ...] = (0.25, 0.5, 0.75, 1.0, 1.5, 2.0) # 菜单中可选的显示缩放比例
+
+    def __init__(self, root: tk.Tk) -> None:
+        self.root: tk.Tk = root
+        self.root.withdraw() # 根窗口只作为各角色窗口的宿主
+        self.root.tk.call('tk', 'scaling', 1.0) # 禁用高DPI缩放，保持原始像素
+
+        # 共用的资源（音效与托盘在显示待机图片之后才初始化）
+        self.audio: AudioEngine | None = None
+        self.tray: pystray.Icon | None = None
+        self.scheduler: FrameScheduler = FrameScheduler(self.root, config["fps"])
+        self.governor: FrameGovernor = FrameGovernor(self.apply_tier)
+        self.governor.enabled = config["governor"]
+        self.scheduler.governor = self.governor
+        self.frame_pool: ThreadPoolExecutor = ThreadPoolExecutor(max_workers=os.cpu_count())
+        self.photos: PhotoCache = PhotoCache(config["frame_memory"] << 20)
+        self.frame_sets: weakref.WeakValueDictionary[str, FrameSet] = weakref.WeakValueDictionary()
+        self.idle_keys: itertools.count[int] = itertools.count()
+
+        self.scale_var: tk.DoubleVar = tk.DoubleVar(self.root, config["scale"]) # 右键菜单中选中的缩放比例
+        self.watch_id: str | None = None
+        self.metrics_window: tk.Toplevel | None = None
+        self.metrics_id: str | None = None
+
+        # 各角色先只显示待机图片
+        self.pets: list[FloatingImage] = []
+        for pet_config in pet_configs():
+            self.add_pet(pet_config, start=False)
+        if not self.pets:
+            raise RuntimeError("没有可以加载的角色")
+
+        # 首次绘制
+        self.root.update()
+        self.first_paint_time: float = time.perf_counter() - START_TIME
+        metrics.record("first_paint", self.first_paint_time)
+        if config["startup_report"]:
+            print(f"首次绘制：{self.first_paint_time * 1000:.1f} ms")
+
+        # 其余部分分阶段初始化，每个阶段之间都会处理积压的事件
+        self.stages: list[tuple[str, Callable[[], None]]] = [
+            ("音效", self.init_audio),
+            ("动画帧", self.init_frames),
+            ("菜单与托盘", self.init_menus),
+        ]
+        self.root.after(0, self.next_stage)
+
+    def next_stage(self) -> None:
+        """执行下一个初始化阶段"""
+        if not self.stages:
+            return
+        name, stage = self.stages.pop(0)
+        start: float = time.perf_counter()
+        stage()
+        if config["startup_report"]:
+            now: float = time.perf_counter()
+            print(f"{name}：{(now - start) * 1000:.1f} ms（启动后 {(now - START_TIME) * 1000:.1f} ms）")
+        if self.stages:
+            self.root.after(0, self.next_stage)
+
+    def finish_startup(self) -> None:
+        """立即执行剩余的全部初始化阶段"""
+        while self.stages:
+            self.next_stage()
+
+    def init_audio(self) -> None:
+        """启动音效引擎（混音器在其工作线程中初始化）"""
+        self.audio = AudioEngine(config["audio_buffer"], config["voices"])
+        for pet in self.pets:
+            self.audio.load(pet.sound)
+
+    def init_frames(self) -> None:
+        for pet in self.pets:
+            pet.init_frames()
+
+    def init_menus(self) -> None:
+        """创建菜单与托盘，并启动定时任务"""
+        for pet in self.pets:
+            pet.create_right_menu()
+        self.create_tray()
+        # 监视角色文件夹
+        if config["watch"]:
+            self.watch_id = self.root.after(self.WATCH_INTERVAL, self.watch)
+        # 性能统计
+        if config["metrics_file"]:
+            self.metrics_id = self.root.after(int(config["metrics_interval"] * 1000), self.dump_metrics)
+
+    def add_pet(self, pet_config: PetConfig, *, start: bool = True) -> FloatingImage | None:
+        """
+        添加角色
+        :param pet_config: 角色文件夹与窗口坐标
+        :param start: 是否立即准备动画帧与菜单（启动时由初始化阶段统一准备）
+        :return: 角色，无法加载时返回 None（跳过该角色）
+        """
+        try:
+            pet: FloatingImage = FloatingImage(self, pet_config["char"])
+        except Exception as e:
+            print(e)
+            return None
+        x: int = pet_config.get("x", self.root.winfo_screenwidth() // 2)
+        y: int = pet_config.get("y", self.root.winfo_screenheight() // 2)
+        pet.set_pos(x, y) # 调整窗口位置
+        self.pets.append(pet)
+        if start:
+            if self.audio is not None:
+                self.audio.load(pet.sound)
+            pet.init_frames()
+            pet.create_right_menu()
+            self.update_tray()
+        return pet
+
+    def ask_pet(self) -> None:
+        """选择角色文件夹并添加角色"""
+        file_path: str = filedialog.askdirectory(
+            title="添加角色…",
+            initialdir=resource_path(""),
+        )
+        if file_path:
+            x, y = self.root.winfo_pointerxy()
+            self.add_pet(PetConfig(char=resource_path(file_path), x=x, y=y))
+            self.save_pets()
+
+    def remove_pet(self, pet: FloatingImage) -> None:
+        """关闭角色（最后一个角色关闭时退出程序）"""
+        if len(self.pets) <= 1:
+            self.shut_app()
+            return
+        self.pets.remove(pet)
+        pet.destroy()
+        self.save_pets()
+        self.update_tray()
+
+    def save_pets(self) -> None:
+        """保存各角色的文件夹与坐标：第一个角色保存在 char, x, y 中，其余的保存在 pets 中"""
+        pet_list: list[PetConfig] = []
+        for pet in self.pets:
+            x, y = pet.get_pos()
+            pet_list.append(PetConfig(char=pet.char, x=x, y=y))
+        first, *others = pet_list
+        config_store.set("char", first["char"])
+        config_store.set("x", first["x"])
+        config_store.set("y", first["y"])
+        config_store.set("pets", others)
+
+    def frame_set(self, sprite: Sprite, cfg: CharConfig, pack: CharPack | None = None) -> FrameSet:
+        """
+        取得角色的动画帧：优先共用内存中缓存键相同的动画帧，其次角色包或磁盘缓存中（内存映射）的图集；
+        都没有时按需生成，并在后台生成图集写入缓存
+        """
+        scale: float = char_scale(cfg)
+        key: str = FrameCache.key(sprite, config["fps"], cfg, scale)
+        frames = self.frame_sets.get(key)
+        if frames is not None:
+            return frames
+
+        resample = Image.Resampling.BILINEAR if cfg.get("smooth", True) else Image.Resampling.NEAREST
+        press_curve, release_curve = char_curves(cfg)
+        size = scale_size(sprite.size, scale)
+        press_sizes = frame_sizes(size, press_curve, cfg["duration_active"] * config["fps"])
+        release_sizes = frame_sizes(size, release_curve, cfg["duration"] * config["fps"])
+        frames = FrameSet(
+            key, sprite, press_sizes, release_sizes, config["fps"], resample, config["frame_memory"] << 20, self.frame_pool
         )
 
+        packed = pack.atlas(key) if pack is not None else None
+        cache = FrameCache(resource_path(config["cache_dir"]), config["cache_size"] << 20)
+        cached = cache.load(key) if packed is None else None
+        if packed is not None:
+            frames.atlas = packed
+            frames.baked.set()
+        elif cached is not None:
+            frames.atlas = cached[0]
+            frames.baked.set()
+        else:
+            frames.baker = threading.Thread(target=frames.bake, args=(cache,), daemon=True)
+            frames.baker.start()
+
+        # 预先生成两段动画的开头几帧
+        frames.press.prefetch(0)
+        frames.release.prefetch(0)
+        self.frame_sets[key] = frames
+        return frames
+
+    def watch(self) -> None:
+        """角色文件夹中的素材变化时，立即热重载"""
+        self.watch_id = None
+        for pet in list(self.pets):
+            if pet.stat_sources() != pet.sources:
+                pet.reload_char()
+        if config["watch"]:
+            self.watch_id = self.root.after(self.WATCH_INTERVAL, self.watch)
+
+    def reload_char(self, char: str) -> None:
+        """热重载使用指定角色文件夹的所有角色"""
+        for pet in self.pets:
+            if pet.char == char:
+                pet.reload_char()
+
+    def reload_app(self) -> None:
+        """重新读取配置文件，按其中的角色列表增删角色，并热重载所有角色"""
+        config_store.flush()
+        old_config: Config = config.copy()
+        try:
+            config.update(load_yaml(resource_path(path_config))) # type: ignore
+        except Exception as e:
+            print(e)
+        self.governor.enabled = config["governor"]
+        if not config["governor"]:
+            self.governor.set_tier(0)
+        self.scheduler.period = self.governor.stride / config["fps"]
+        self.scale_var.set(config["scale"])
+        if self.audio is not None and (config["audio_buffer"], config["voices"]) != (old_config["audio_buffer"], old_config["voices"]):
+            self.audio.close()
+            self.init_audio() # 混音器重新初始化后须重新加载音效
+        if config["watch"] and self.watch_id is None:
+            self.watch_id = self.root.after(self.WATCH_INTERVAL, self.watch)
+        if config["metrics_file"] and self.metrics_id is None:
+            self.metrics_id = self.root.after(int(config["metrics_interval"] * 1000), self.dump_metrics)
+
+        wanted: list[PetConfig] = pet_configs()
+        for pet in self.pets[len(wanted):]:
+            self.pets.remove(pet)
+            pet.destroy()
+        for pet, pet_config in zip(self.pets, wanted):
+            pet.window.attributes('-topmost', config["topmost"])
+            pet.reload_char(pet_config["char"])
+        for pet_config in wanted[len(self.pets):]:
+            self.add_pet(pet_config)
+        self.update_tray()
+
+    def dump_metrics(self) -> None:
+        """定期将性能统计写入文件"""
+        self.metrics_id = None
+        if not config["metrics_file"]:
+            return
+        metrics.dump(resource_path(config["metrics_file"]))
+        self.metrics_id = self.root.after(int(config["metrics_interval"] * 1000), self.dump_metrics)
+
+    def show_metrics(self) -> None:
+        """显示实时刷新的性能统计窗口"""
+        if self.metrics_window is not None:
+            self.metrics_window.deiconify()
+            self.metrics_window.lift()
+            return
+        window: tk.Toplevel = tk.Toplevel(self.root)
+        window.title("性能统计")
+        window.attributes('-topmost', True)
+        label: tk.Label = tk.Label(window, justify=tk.LEFT, anchor=tk.NW, font="TkFixedFont", padx=8, pady=8)
+        label.pack(fill=tk.BOTH, expand=True)
+        self.metrics_window = window
+
+        def refresh() -> None:
+            if self.metrics_window is not window:
+                return
+            reports: list[str] = [
+                metrics.report(), f"角色 {len(self.pets)} 个，共用动画帧 {len(self.frame_sets)} 份",
+                *(f"  {key[:8]}：{frames.report()}" for key, frames in list(self.frame_sets.items())),
+                self.scheduler.report(), self.photos.report(),
+            ]
+            if self.audio is not None:
+                reports.append(self.audio.report())
+            label.config(text="\n".join(reports))
+            window.after(500, refresh)
+
+        def close() -> None:
+            self.metrics_window = None
+            window.destroy()
+
+        window.protocol("WM_DELETE_WINDOW", close)
+        refresh()
+
+    def summon(self) -> None:
+        """将所有角色召唤至窗口顶层"""
+        for pet in self.pets:
+            pet.summon()
+
+    def back_to_screen(self) -> None:
+        for pet in self.pets:
+            pet.back_to_screen()
+
+    def switch_topmost(self) -> None:
+        """切换窗口置顶状态"""
+        config_store.set("topmost", not config["topmost"])
+        for pet in self.pets:
+            pet.window.attributes('-topmost', config["topmost"])
+
+    def apply_tier(self) -> None:
+        """按调节器的档位调整帧间隔（动画帧不变）"""
+        self.scheduler.period = self.governor.stride / config["fps"]
+        if self.tray is not None: # 只有帧率显示变化，无需重新加载托盘图标
+            self.tray.update_menu()
+
+    def set_scale(self, scale: float) -> None:
+        """更改所有角色的显示缩放比例"""
+        self.scale_var.set(scale)
+        if scale == config["scale"]:
+            return
+        config_store.set("scale", scale)
+        for pet in self.pets:
+            pet.rescale()
+        self.update_tray()
+
+    def in_tk(self, func: Callable[[], None]) -> Callable[[], None]:
+        """托盘菜单在托盘线程中回调，须转交Tk线程执行"""
+        return lambda: self.root.after(0, func)
+
+    def tray_items(self) -> Iterator[pystray.MenuItem]:
+        """托盘菜单（每次显示时重新生成，以反映角色的增删）"""
+        import pystray
+        from pystray import MenuItem
+
+        def pet_items(pet: FloatingImage) -> tuple[MenuItem, ...]:
+            return (
+                MenuItem('更换中旋…', self.in_tk(pet.change_sound), enabled=lambda item: pet.pack is None),
+                MenuItem('更换晴…', self.in_tk(pet.change_image), enabled=lambda item: pet.pack is None),
+                MenuItem('读取角色配置…', self.in_tk(pet.load_char)),
+                MenuItem('克隆角色配置…', self.in_tk(pet.dump_char)),
+                MenuItem('导入角色包…', self.in_tk(pet.import_pack)),
+                MenuItem('导出角色包…', self.in_tk(pet.export_pack)),
+            )
+
+        yield MenuItem('召唤', self.in_tk(self.summon), default=True)
+        if len(self.pets) == 1:
+            yield from pet_items(self.pets[0])
+        else:
+            for pet in self.pets:
+                yield MenuItem(pet.name, pystray.Menu(
+                    MenuItem('召唤', self.in_tk(pet.summon)), *pet_items(pet), MenuItem('关闭', self.in_tk(pet.close))
+                ))
+        yield MenuItem('添加角色…', self.in_tk(self.ask_pet))
+        yield MenuItem('缩放', pystray.Menu(*(
+            MenuItem(
+                f"{scale:.0%}", self.in_tk(functools.partial(self.set_scale, scale)),
+                checked=lambda item, scale=scale: config["scale"] == scale, radio=True
+            )
+            for scale in self.SCALES
+        )))
+        yield MenuItem('切换置顶', self.in_tk(self.switch_topmost))
+        yield MenuItem('找回走失的晴', self.in_tk(self.back_to_screen))
+        yield MenuItem(f'帧率：{self.governor.describe()}', lambda: None, enabled=False)
+        yield MenuItem('性能统计', self.in_tk(self.show_metrics))
+        yield MenuItem('重新加载', self.in_tk(self.reload_app))
+        yield MenuItem('退出', self.in_tk(self.shut_app))
+
+    def create_tray(self) -> None:
+        """创建系统托盘（所有角色共用一个，图标取第一个角色的）"""
+        # 没有图形界面时导入 pystray 就会失败，因此推迟到创建托盘时才导入
+        import pystray
+
         # 创建托盘
-        self.tray = pystray.Icon("floating_image", tray_icon, char_config.get("name", os.path.basename(config["char"])), tray_menu)
+        self.tray = pystray.Icon("floating_image", self.pets[0].load_tray_icon(), self.pets[0].name, pystray.Menu(self.tray_items))
 
         # 后台运行托盘
         threading.Thread(target=self.tray.run, daemon=True).start()
 
+    def update_tray(self) -> None:
+        """角色增删或更换后，更新托盘的图标、标题与菜单"""
+        if self.tray is None:
+            return
+        self.tray.icon = self.pets[0].load_tray_icon()
+        self.tray.title = "、".join(pet.name for pet in self.pets)
+        self.tray.update_menu()
+
     def quit(self) -> None:
-        self.animating = ""
-        self.press_animation.clear()
-        self.release_animation.clear()
-        self.tray.stop()
-        self.canvas.destroy()
+        if self.watch_id is not None:
+            self.root.after_cancel(self.watch_id)
+        if self.metrics_id is not None:
+            self.root.after_cancel(self.metrics_id)
+        if config["metrics_file"]:
+            metrics.dump(resource_path(config["metrics_file"]))
+        self.scheduler.stop()
+        if self.audio is not None:
+            self.audio.close()
+        for frames in list(self.frame_sets.values()):
+            frames.cancel()
+            frames.clear()
+        self.frame_pool.shutdown(wait=False, cancel_futures=True)
+        for pet in self.pets:
+            pet.destroy()
+        self.photos.clear()
+        if self.tray is not None:
+            self.tray.stop()
         self.root.quit()
         self.root.destroy()
-        dump_config()
-        time.sleep(1)
-        # dump_char_config()
-    
+        config_store.close()
+
     def shut_app(self) -> None:
         """退出程序"""
         self.quit()
         sys.exit(0)
 
-    def restart_app(self) -> None:
-        """重启程序"""
-        self.quit()
-        main()
+
+# 离线渲染的输出格式及其扩展名
+RENDER_FORMATS: dict[str, str] = {"sheet": ".png", "apng": ".png", "gif": ".gif", "webp": ".webp", "raw": ".rgba"}
+
+def render_names(chars: list[str]) -> list[str]:
+    """
+    为各角色分配渲染输出的子文件夹名：默认为角色文件夹名（角色包则去掉扩展名），
+    与前面的角色重名时（不同位置的同名文件夹，或同名的文件夹与角色包）依次加上 -2、-3… 后缀；
+    比较时不区分大小写，以免在 Windows 上写入同一文件夹
+    :param chars: 角色文件夹或角色包
+    :return: 与 chars 一一对应的子文件夹名
+    """
+    bases: list[str] = [os.path.splitext(os.path.basename(os.path.normpath(char)))[0] for char in chars]
+    used: set[str] = {base.casefold() for base in bases}
+    seen: set[str] = set()
+    names: list[str] = []
+    for base in bases:
+        name: str = base
+        if base.casefold() in seen:
+            suffix: int = 2
+            while f"{base}-{suffix}".casefold() in used:
+                suffix += 1
+            name = f"{base}-{suffix}"
+            used.add(name.casefold())
+        seen.add(base.casefold())
+        names.append(name)
+    return names
+
+
+def render_char(char: str, output: str, name: str, fmt: str, fps: int, scale: float, workers: int) -> dict[str, Any]:
+    """
+    离线渲染一个角色的按下与回弹动画（不需要Tk、pygame与托盘，可在子进程中运行）
+    :param char: 角色文件夹或角色包
+    :param output: 输出文件夹（每个角色一个子文件夹）
+    :param name: 子文件夹名，见 render_names
+    :param fmt: 输出格式，见 RENDER_FORMATS
+    :param fps: 帧率
+    :param scale: 显示缩放比例（与角色配置中的缩放比例相乘）
+    :param workers: 生成动画帧的线程数
+    :return: 渲染结果摘要
+    """
+    start: float = time.perf_counter()
+    cfg: CharConfig = load_char_config(char)
+    pack: CharPack | None = load_char_pack(char) if is_char_pack(char) else None
+    if pack is not None:
+        sprite = pack.sprite("image_active", 0) or pack.sprite("image", 0)
+        if sprite is None:
+            raise ValueError("角色包中没有图像")
+    else:
+        sprite = Sprite.open(char_res_path(cfg.get("image_active", cfg["image"]), char), 0)
+
+    # 与 PetHost.frame_set 相同的帧尺寸与图像帧序号，使渲染结果与运行时一致
+    resample = Image.Resampling.BILINEAR if cfg.get("smooth", True) else Image.Resampling.NEAREST
+    size: tuple[int, int] = scale_size(sprite.size, scale * cfg.get("scale", 1.0))
+    canvas: tuple[int, int] = (int(size[0] / (1 - abs(cfg["factor"]))), int(size[1] / (1 - abs(cfg["factor"]))))
+    press_curve, release_curve = char_curves(cfg)
+    animations: dict[str, list[tuple[int, int]]] = {
+        "press": frame_sizes(size, press_curve, cfg["duration_active"] * fps),
+        "release": frame_sizes(size, release_curve, cfg["duration"] * fps),
+    }
+    baked = bake_frames(sprite, [
+        [(sprite.locate(index / fps)[0], frame_size) for index, frame_size in enumerate(sizes)] for sizes in animations.values()
+    ], resample, workers)
+
+    folder: str = os.path.join(output, name)
+    os.makedirs(folder, exist_ok=True)
+    files: list[str] = []
+    composed: dict[int, Image.Image] = {} # 重复的帧只合成一次
+    for animation, frames in zip(animations, baked):
+        images: list[Image.Image] = []
+        for frame in frames: # 与 FloatingImage.frame_pos 相同：完整帧底部居中
+            if id(frame) not in composed:
+                image = Image.new("RGBA", canvas, (0, 0, 0, 0))
+                image.paste(frame.image, ((canvas[0] - frame.size[0]) // 2 + frame.offset[0], canvas[1] - frame.size[1] + frame.offset[1]))
+                composed[id(frame)] = image
+            images.append(composed[id(frame)])
+        path: str = os.path.join(folder, animation + RENDER_FORMATS[fmt])
+        duration: float = 1000 / fps
+        if fmt == "sheet": # 各帧从左到右、从上到下排列，另附帧信息
+            columns: int = math.isqrt(len(images) - 1) + 1 if images else 1 # 向上取整的平方根
+            rows: int = max(-(-len(images) // columns), 1)
+            sheet = Image.new("RGBA", (canvas[0] * columns, canvas[1] * rows), (0, 0, 0, 0))
+            for index, image in enumerate(images):
+                sheet.paste(image, (index % columns * canvas[0], index // columns * canvas[1]))
+            sheet.save(path)
+            with open(os.path.join(folder, animation + ".json"), "w") as f:
+                json.dump({"frame_size": canvas, "frames": len(images), "columns": columns, "fps": fps}, f)
+        elif fmt == "raw": # 各帧的RGBA像素依次存放，另附帧信息
+            with open(path, "wb") as f:
+                for image in images:
+                    f.write(image.tobytes())
+            with open(os.path.join(folder, animation + ".json"), "w") as f:
+                json.dump({"frame_size": canvas, "frames": len(images), "fps": fps, "mode": "RGBA"}, f)
+        elif fmt == "gif":
+            images[0].save(path, save_all=True, append_images=images[1:], duration=duration, loop=0, disposal=2)
+        elif fmt == "webp":
+            images[0].save(path, save_all=True, append_images=images[1:], duration=duration, loop=0, lossless=True)
+        else:
+            images[0].save(path, save_all=True, append_images=images[1:], duration=duration, loop=0, disposal=1, default_image=False)
+        files.append(path)
+    return {
+        "char": char, "ok": True, "folder": folder, "files": files, "frames": {animation: len(frames) for animation, frames in zip(animations, baked)},
+        "unique_frames": len(composed), "size": canvas, "seconds": time.perf_counter() - start,
+    }
+
+
+def render_main(argv: list[str]) -> int:
+    """
+    离线批量渲染角色动画：python main.py render 角色... -o 输出文件夹
+    多个角色在子进程中并行渲染，每渲染完一个角色就输出一行JSON
+    :return: 退出码（有角色渲染失败时为 1）
+    """
+    import argparse
+    parser = argparse.ArgumentParser(prog="main.py render", description="离线渲染角色的按下与回弹动画")
+    parser.add_argument("chars", nargs="+", metavar="CHAR", help="角色文件夹或角色包")
+    parser.add_argument("-o", "--output", default="render", help="输出文件夹")
+    parser.add_argument("-f", "--format", default="apng", choices=RENDER_FORMATS, help="输出格式（sheet 为精灵图，raw 为RGBA像素）")
+    parser.add_argument("--fps", type=int, default=default_config["fps"], help="帧率")
+    parser.add_argument("--scale", type=float, default=default_config["scale"], help="显示缩放比例")
+    parser.add_argument("-j", "--jobs", type=int, default=os.cpu_count() or 1, help="并行的进程数")
+    args = parser.parse_args(argv)
+
+    global config
+    config = default_config.copy()
+    chars: list[str] = list(dict.fromkeys(args.chars)) # 重复指定的角色只渲染一次
+    jobs: int = max(min(args.jobs, len(chars)), 1)
+    workers: int = max((os.cpu_count() or 1) // jobs, 1)
+    failed: int = 0
+
+    def report(result: dict[str, Any]) -> None:
+        print(json.dumps(result, ensure_ascii=False), flush=True)
+
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures: dict[Future[dict[str, Any]], str] = {
+            pool.submit(render_char, char, args.output, name, args.format, args.fps, args.scale, workers): char
+            for char, name in zip(chars, render_names(chars))
+        }
+        for future in as_completed(futures):
+            try:
+                report(future.result())
+            except Exception as e:
+                failed += 1
+                report({"char": futures[future], "ok": False, "error": f"{type(e).__name__}: {e}"})
+    return 1 if failed else 0
+
+
+def pet_configs() -> list[PetConfig]:
+    """按配置列出要显示的角色：char 所指的角色，以及 pets 中的其余角色"""
+    first: PetConfig = PetConfig(char=config["char"])
+    for key in ("x", "y"):
+        if key in config:
+            first[key] = config[key] # type: ignore
+    return [first] + [PetConfig(pet) for pet in config["pets"] if "char" in pet] # type: ignore
 
 
 def main() -> None:
+    # 离线渲染
+    if sys.argv[1:2] == ["render"]:
+        sys.exit(render_main(sys.argv[2:]))
+
     # 加载配置
+    global config_store
     if not os.path.exists(resource_path(path_config)): dump_config(default_config)
-    load_config()
-    dump_config()
-    load_char_config()
-    # dump_char_config()
-    
-    # 创建主窗口
-    root: tk.Tk = tk.Tk()
+    loaded = load_config()
+    config_store = ConfigStore(resource_path(path_config), config) # type: ignore
+    config_store.write({key: config[key] for key in config.keys() - loaded.keys()}) # 补全配置文件中缺失的字段
 
-    # 设置透明背景（支持透明像素）
-    root.attributes('-alpha', 1.0)
+    # 创建主窗口（隐藏，作为各角色窗口的宿主）
+    root: tk.Tk = tk.Tk()
 
-    # 创建悬浮图片实例
-    app: FloatingImage = FloatingImage(root)
+    # 创建宿主并显示各角色
+    host: PetHost = PetHost(root)
 
     # 运行主循环
     root.mainloop()
 
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support() # 打包后的程序中，离线渲染的子进程不应再次启动桌宠
     main()